@@ -0,0 +1,108 @@
+import numpy as np
+
+
+def euler_to_matrices(euler_angles: np.ndarray) -> np.ndarray:
+    """
+    Rotation matrices of an array of euler angles (order "XYZ", like blender's default rotation_mode)
+
+    Parameters
+    ----------
+    euler_angles: np.ndarray
+        The angles in radians with the shape (N, 3)
+    """
+    cx, cy, cz = np.cos(euler_angles).T
+    sx, sy, sz = np.sin(euler_angles).T
+    return np.stack([
+        np.stack([cy * cz, sx * sy * cz - cx * sz, cx * sy * cz + sx * sz], axis=-1),
+        np.stack([cy * sz, sx * sy * sz + cx * cz, cx * sy * sz - sx * cz], axis=-1),
+        np.stack([-sy, sx * cy, cx * cy], axis=-1),
+    ], axis=1)
+
+
+def track_y_quaternions(directions: np.ndarray) -> np.ndarray:
+    """
+    The shortest rotations (w, x, y, z) turning the Y-axis into the given directions, which is what
+    a ("DAMPED_TRACK") constraint does with a bone
+
+    Parameters
+    ----------
+    directions: np.ndarray
+        Normalized directions with the shape (N, 3)
+    """
+    # Half-way quaternion between (0, 1, 0) and the direction: (1 + y, cross((0, 1, 0), direction))
+    quaternions = np.stack([
+        1 + directions[:, 1], directions[:, 2], np.zeros(len(directions)), -directions[:, 0]
+    ], axis=1)
+    length = np.linalg.norm(quaternions, axis=1, keepdims=True)
+
+    # Directions opposite to the Y-axis are a rotation by 180 degrees around the X-axis
+    opposite = length[:, 0] < 1e-6
+    quaternions[opposite] = (0, 1, 0, 0)
+    length[opposite] = 1
+    return quaternions / length
+
+
+def quaternions_to_matrices(quaternions: np.ndarray) -> np.ndarray:
+    """
+    Rotation matrices of an array of normalized quaternions (w, x, y, z)
+
+    Parameters
+    ----------
+    quaternions: np.ndarray
+        The quaternions with the shape (N, 4)
+    """
+    w, x, y, z = quaternions.T
+    return np.stack([
+        np.stack([1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)], axis=-1),
+        np.stack([2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)], axis=-1),
+        np.stack([2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)], axis=-1),
+    ], axis=1)
+
+
+def bone_rotations(order: list, parents: dict, rest_matrices: dict, targets: dict, target_position) -> tuple:
+    """
+    Compute the pose-bone rotations (rotation_quaternion) of all frames at once, such that every
+    tracking bone points at its target like its ("DAMPED_TRACK") constraint would. The armature is
+    posed bone by bone (parents first), all other bones stay in their rest pose. Returns the 
+    rotations of the tracking bones and the posed heads of all bones
+
+    Parameters
+    ----------
+    order: list
+        The names of the bones, parents before their children
+    parents: dict
+        The name of the parent of every bone (None for root bones)
+    rest_matrices: dict
+        The rest matrix (Bone.matrix_local) of every bone as array with the shape (4, 4)
+    targets: dict
+        Key->value pairs (bone->targeted_bone) of the tracking bones
+    target_position: function
+        Called with the name of the targeted bone and the (posed) bone heads computed so far,
+        returns the positions of the target in armature space with the shape (N, 3)
+    """
+    pose_matrices = {}
+    heads = {}
+    rotations = {}
+
+    for name in order:
+        parent = parents[name]
+        if parent is None:
+            matrix = rest_matrices[name][None]
+        else:
+            matrix = pose_matrices[parent] @ (np.linalg.inv(rest_matrices[parent]) @ rest_matrices[name])
+        heads[name] = matrix[:, :3, 3]
+
+        if name in targets:
+            direction = target_position(targets[name], heads) - heads[name]
+            direction /= np.linalg.norm(direction, axis=1, keepdims=True)
+            # Direction inside the bone's own space
+            local_direction = (np.swapaxes(matrix[:, :3, :3], 1, 2) @ direction[..., None])[..., 0]
+            rotations[name] = track_y_quaternions(local_direction)
+
+            basis = np.tile(np.eye(4), (len(rotations[name]), 1, 1))
+            basis[:, :3, :3] = quaternions_to_matrices(rotations[name])
+            matrix = matrix @ basis
+
+        pose_matrices[name] = matrix
+
+    return rotations, heads
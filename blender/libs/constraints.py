@@ -0,0 +1,151 @@
+import numpy as np
+
+
+# Range (in degrees) of the angle at a joint between the segment targeting it and the segment
+# it targets, 0 is a stretched limb. With a hinge axis (pair of joints) and a rest direction (pair
+# of joint groups) the range is signed, i.e. the limb can only bend into one direction. The axis is
+# given in the rest pose, where the segment targeting the joint points into the rest direction
+# (from the center of the first group to the center of the second), and turns with that segment
+_TORSO = (("shoulder01.R", "shoulder01.L"), ("upperleg01.R", "upperleg01.L"))
+JOINT_LIMITS = {
+    "lowerarm01.L": (0, 150, ("shoulder01.L", "shoulder01.R"), _TORSO),
+    "lowerarm01.R": (0, 150, ("shoulder01.L", "shoulder01.R"), _TORSO),
+    "lowerleg01.L": (0, 150, ("upperleg01.R", "upperleg01.L"), _TORSO),
+    "lowerleg01.R": (0, 150, ("upperleg01.R", "upperleg01.L"), _TORSO),
+}
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """
+    Normalize an array of vectors along its last axis, zero vectors stay zero
+
+    Parameters
+    ----------
+    vectors: np.ndarray
+        The vectors with the shape (..., 3)
+    """
+    length = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, length, out=np.zeros_like(vectors), where=length > 1e-9)
+
+
+def swing(vectors: np.ndarray, rest: np.ndarray, directions: np.ndarray) -> np.ndarray:
+    """
+    Rotate vectors by the shortest rotation from the (normalized) rest directions to the directions,
+    i.e. without twist around the directions. Opposite directions have no such rotation, their
+    vectors become zero
+
+    Parameters
+    ----------
+    vectors: np.ndarray
+        The vectors to rotate with the shape (N, 3)
+    rest: np.ndarray
+        The rest directions with the shape (N, 3)
+    directions: np.ndarray
+        The directions with the shape (N, 3)
+    """
+    cross = np.cross(rest, directions)
+    cos = np.sum(rest * directions, axis=-1, keepdims=True)
+    factor = np.divide(1, 1 + cos, out=np.zeros_like(cos), where=1 + cos > 1e-6)
+    rotated = vectors * cos + np.cross(cross, vectors) + cross * np.sum(cross * vectors, axis=-1, keepdims=True) * factor
+    return np.where(1 + cos > 1e-6, rotated, 0)
+
+
+def clamp_direction(parent_direction: np.ndarray, direction: np.ndarray, limit: tuple, axis: np.ndarray = None) -> np.ndarray:
+    """
+    Clamp the angle between the (normalized) directions of two successive segments to a range,
+    frames without a plane to clamp in (parallel segments, degenerate axes) keep their direction
+
+    Parameters
+    ----------
+    parent_direction: np.ndarray
+        The directions of the segment targeting the joint with the shape (N, 3)
+    direction: np.ndarray
+        The directions of the segment starting at the joint with the shape (N, 3)
+    limit: tuple
+        The minimum and maximum angle in degrees
+    axis: np.ndarray = None
+        The hinge axes with the shape (N, 3), if the joint is a hinge
+    """
+    lower, upper = np.radians(limit[0]), np.radians(limit[1])
+    dot = np.sum(parent_direction * direction, axis=-1)
+
+    if axis is None:
+        angle = np.arccos(np.clip(dot, -1, 1))
+        # The direction perpendicular to the parent segment inside the plane of both segments
+        perpendicular = normalize(direction - dot[:, None] * parent_direction)
+    else:
+        # The hinge axis has to be perpendicular to the parent segment
+        axis = normalize(axis - np.sum(axis * parent_direction, axis=-1, keepdims=True) * parent_direction)
+        perpendicular = np.cross(axis, parent_direction)
+        angle = np.arctan2(np.sum(np.cross(parent_direction, direction) * axis, axis=-1), dot)
+
+    clamped = np.clip(angle, lower, upper)
+    valid = np.any(perpendicular != 0, axis=-1, keepdims=True)
+    return np.where(valid, np.cos(clamped)[:, None] * parent_direction + np.sin(clamped)[:, None] * perpendicular, direction)
+
+
+def hinge_axis(positions: dict, parent_direction: np.ndarray, limit: tuple) -> np.ndarray:
+    """
+    The hinge axes of a joint in the frame of the segment targeting it (see JOINT_LIMITS),
+    None if the joint is no hinge or its joints were not estimated
+
+    Parameters
+    ----------
+    positions: dict
+        The estimated positions of every joint (joint->array with the shape (N, 3))
+    parent_direction: np.ndarray
+        The directions of the segment targeting the joint with the shape (N, 3)
+    limit: tuple
+        The range of the joint, see JOINT_LIMITS
+    """
+    if len(limit) < 4 or any(name not in positions for name in limit[2] + limit[3][0] + limit[3][1]):
+        return None
+    center = lambda names: np.mean([positions[name] for name in names], axis=0)
+    rest = normalize(center(limit[3][1]) - center(limit[3][0]))
+    return swing(positions[limit[2][1]] - positions[limit[2][0]], rest, parent_direction)
+
+
+def solve(positions: dict, connections: dict, limits: dict = JOINT_LIMITS) -> dict:
+    """
+    Enforce joint limits on the landmark positions of all frames at once. Starting from the joints 
+    which are not targeted (e.g. shoulders and hips), every segment keeps its estimated direction, 
+    clamped to the joint limits, and its estimated length. Only the directions of the segments are
+    used for the landmarks, their lengths are given by the rig
+
+    Parameters
+    ----------
+    positions: dict
+        The estimated positions of every joint (joint->array with the shape (N, 3))
+    connections: dict
+        Key->value pairs (bone->targeted_bone) defining the segments
+    limits: dict = JOINT_LIMITS
+        The ranges of the joints, see JOINT_LIMITS
+    """
+    targeted_by = {target: bone_id for bone_id, target in connections.items()}
+    solved = {bone_id: positions[bone_id] for bone_id in connections if bone_id not in targeted_by and bone_id in positions}
+
+    pending = [(bone_id, target) for bone_id, target in connections.items() if target in positions]
+    while pending:
+        remaining = []
+        for bone_id, target in pending:
+            if bone_id not in solved:
+                remaining.append((bone_id, target))
+                continue
+
+            offset = positions[target] - positions[bone_id]
+            direction = normalize(offset)
+            if bone_id in limits and bone_id in targeted_by:
+                parent_direction = normalize(solved[bone_id] - solved[targeted_by[bone_id]])
+                limit = limits[bone_id]
+                axis = hinge_axis(positions, parent_direction, limit)
+                if len(limit) < 4 or axis is not None:
+                    direction = clamp_direction(parent_direction, direction, limit, axis)
+
+            solved[target] = solved[bone_id] + direction * np.linalg.norm(offset, axis=-1, keepdims=True)
+
+        # Segments whose start can never be solved (cyclic connections) are dropped
+        if len(remaining) == len(pending):
+            break
+        pending = remaining
+
+    return {bone_id: solved.get(bone_id, pos) for bone_id, pos in positions.items()}
@@ -0,0 +1,160 @@
+import bpy
+import time
+import socket
+import numpy as np
+
+from preprocess.landmarks import landmarkSequence
+from preprocess.live import BONES, DEFAULT_PORT, unpackFrame
+
+
+# The model's rotation and location are found by means of these landmarks
+BODY = [BONES.index(name) for name in ("shoulder01.R", "shoulder01.L", "upperleg01.R", "upperleg01.L")]
+
+
+class Receiver:
+    """
+    A non-blocking UDP socket receiving the landmark packets of preprocess/live.py
+
+    ...
+
+    Methods
+    -------
+    latest(self) -> tuple
+        Drains all pending packets and returns the newest one
+    close(self) -> None
+        Closes the socket
+    """
+
+    def __init__(self, port: int = DEFAULT_PORT, host: str = "127.0.0.1") -> None:
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind((host, port))
+        self.socket.setblocking(False)
+        self.sequence = -1
+        self.timestamp = 0.0
+
+    def latest(self) -> tuple:
+        """
+        Drains all pending packets and returns the newest one as (sequence, capture time, landmarks),
+        None if no new packet has arrived. Older packets are dropped, only the latest frame matters
+        """
+        newest = None
+        while True:
+            try:
+                packet = self.socket.recv(65535)
+            except BlockingIOError:
+                break
+            frame = unpackFrame(packet)
+            # UDP might reorder packets, older ones have a lower sequence number and capture time.
+            # A restarted sender numbers from 0 again, but captures later
+            if frame[0] > self.sequence or frame[1] > self.timestamp:
+                self.sequence, self.timestamp = frame[0], frame[1]
+                newest = frame
+        return newest
+
+    def close(self) -> None:
+        self.socket.close()
+
+
+class LivePose(bpy.types.Operator):
+    """
+    A modal timer operator posing a model directly (without keyframes) by the latest landmarks
+    streamed by preprocess/live.py, until ESC is pressed. The model and the parameters are set
+    via start()
+    """
+    bl_idname = "wm.pose_mapper_live"
+    bl_label = "Pose-Mapper Live"
+
+    model = None
+    convert_func = None
+    port: int = DEFAULT_PORT
+    # Weight of the previous (smoothed) landmarks, 0 disables the smoothing
+    smoothing: float = 0.5
+    interval: float = 1 / 60
+
+    def invoke(self, context, event) -> set:
+        self.receiver = Receiver(self.port)
+        # The first received frame and the smoothed current one, the translation of the model
+        # is relative to the first frame
+        self.sequence = landmarkSequence(BONES, 2)
+        self.latencies = []
+        self.last_report = time.time()
+
+        self.timer = context.window_manager.event_timer_add(self.interval, window=context.window)
+        context.window_manager.modal_handler_add(self)
+        return {"RUNNING_MODAL"}
+
+    def modal(self, context, event) -> set:
+        if event.type == "ESC":
+            self.cancel(context)
+            return {"CANCELLED"}
+        if event.type != "TIMER":
+            return {"PASS_THROUGH"}
+
+        frame = self.receiver.latest()
+        # Frames without the body (e.g. only hands) can not pose the model
+        if frame is not None and not np.isnan(frame[2][BODY, 0]).any():
+            self.apply(frame[2])
+            self.report_latency(context, time.time() - frame[1])
+        return {"PASS_THROUGH"}
+
+    def cancel(self, context) -> None:
+        context.window_manager.event_timer_remove(self.timer)
+        context.workspace.status_text_set(None)
+        self.receiver.close()
+
+    def smooth(self, landmarks: np.ndarray) -> None:
+        """
+        Incremental (exponential) smoothing of the landmarks in place into the current frame of
+        the sequence, landmarks which were not found keep their previous position
+        """
+        smoothed = self.sequence[1]
+        found = ~np.isnan(landmarks[:, 0])
+        unknown = np.isnan(smoothed[:, 0])
+        smoothed[found & unknown] = landmarks[found & unknown]
+        known = found & ~unknown
+        smoothed[known] = self.smoothing * smoothed[known] + (1 - self.smoothing) * landmarks[known]
+
+    def apply(self, landmarks: np.ndarray) -> None:
+        if len(self.sequence) == 0:
+            self.sequence.append()[:] = landmarks
+            self.sequence.append()
+
+        self.smooth(landmarks)
+        clip = self.model.compute_clip(self.sequence, self.convert_func, 1)
+        self.model.pose_frame(clip, 1, toggle_mode=False)
+
+    def report_latency(self, context, latency: float) -> None:
+        self.latencies.append(latency)
+        if time.time() - self.last_report >= 1:
+            text = "Live: {:.1f} ms end-to-end latency, {} frames/s".format(
+                np.mean(self.latencies) * 1000, len(self.latencies))
+            context.workspace.status_text_set(text)
+            print(text)
+            self.latencies = []
+            self.last_report = time.time()
+
+
+def start(model, convert_func, port: int = DEFAULT_PORT, smoothing: float = 0.5) -> None:
+    """
+    Start posing the model live, requires blender's UI (modal operators do not run in background mode)
+
+    Parameters
+    ----------
+    model: Model
+        The model to pose, the bones of baked models are rotated directly
+    convert_func: function
+        The XYZ-format of pose-estimators might be different than blender,
+        provide a conversion function
+    port: int = DEFAULT_PORT
+        The port preprocess/live.py publishes to
+    smoothing: float = 0.5
+        Weight of the previous landmarks in the incremental smoothing, 0 disables the smoothing
+    """
+    LivePose.model = model
+    LivePose.convert_func = convert_func
+    LivePose.port = port
+    LivePose.smoothing = smoothing
+
+    if not hasattr(bpy.types, "WM_OT_pose_mapper_live"):
+        bpy.utils.register_class(LivePose)
+    bpy.ops.wm.pose_mapper_live("INVOKE_DEFAULT")
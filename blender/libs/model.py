@@ -1,11 +1,75 @@
-from typing import Type
-from bpy.types import Armature, Function, Object, PoseBone
+from typing import TYPE_CHECKING, Type
+from bpy.types import Action, Armature, Function, NlaStrip, Object, PoseBone
 from mathutils import Euler, Matrix, Vector
 from enum import Enum
 import numpy as np
 import bpy
 import copy
 
+from . import bake as baking
+from . import constraints
+from .util import conversion_matrix
+
+if TYPE_CHECKING:
+    from preprocess.landmarks import landmarkSequence
+
+
+def fill_missing(values: np.ndarray) -> np.ndarray:
+    """
+    Fill the frames in which a landmark was not found (NaN) with the last (or first) frame it 
+    was found in, returns None if it was not found at all
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The positions of the landmark with the shape (N, 3)
+    """
+    found = ~np.isnan(values[:, 0])
+    if not found.any():
+        return None
+    if found.all():
+        return values
+
+    indices = np.maximum.accumulate(np.where(found, np.arange(len(values)), 0))
+    indices[:np.argmax(found)] = np.argmax(found)
+    return values[indices]
+
+
+def matrices_to_euler(rows: np.ndarray) -> np.ndarray:
+    """
+    Vectorized equivalent of mathutils' ``Matrix(rows).to_euler()`` (order "XYZ") for an 
+    array of (not necessarily orthonormal) 3x3 matrices given by their rows
+
+    Parameters
+    ----------
+    rows: np.ndarray
+        The matrices with the shape (N, 3, 3)
+    """
+    # mathutils normalizes the columns before the decomposition
+    mat = rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+    cy = np.hypot(mat[:, 0, 0], mat[:, 1, 0])
+    eul1 = np.stack([
+        np.arctan2(mat[:, 2, 1], mat[:, 2, 2]),
+        np.arctan2(-mat[:, 2, 0], cy),
+        np.arctan2(mat[:, 1, 0], mat[:, 0, 0])
+    ], axis=1)
+    eul2 = np.stack([
+        np.arctan2(-mat[:, 2, 1], -mat[:, 2, 2]),
+        np.arctan2(-mat[:, 2, 0], -cy),
+        np.arctan2(-mat[:, 1, 0], -mat[:, 0, 0])
+    ], axis=1)
+    # Gimbal lock
+    eul3 = np.stack([
+        np.arctan2(-mat[:, 1, 2], mat[:, 1, 1]),
+        np.arctan2(-mat[:, 2, 0], cy),
+        np.zeros(len(mat))
+    ], axis=1)
+
+    use_eul2 = np.abs(eul1).sum(axis=1) > np.abs(eul2).sum(axis=1)
+    eul = np.where(use_eul2[:, None], eul2, eul1)
+    return np.where((cy > 16 * np.finfo(np.float32).eps)[:, None], eul, eul3)
+
 
 class Joint:
     """
@@ -26,9 +90,10 @@ class Joint:
     name: str
         The name of the joint
     bone: PoseBone
-        The according posebone inside the blender environment
+        The according posebone inside the blender environment, None for joints which
+        are only landmarks (e.g. finger tips)
     constraint: Object
-        The ("DAMPED-TRACK") bone-constraint targeting the landmark
+        The ("DAMPED-TRACK") bone-constraint targeting the landmark, None if there is no bone
     has_landmark: bool
         Indicates whether this particular joint has a landmark, only 
         certain joints are landmarked
@@ -67,24 +132,26 @@ class Joint:
         """
         self.model = model
         self.name = name
-        self.bone = model.model.pose.bones[name]
+        self.bone = model.model.pose.bones.get(name)
         self.has_landmark = create_landmark
         if create_landmark:
             self.landmark = self.create_landmark()
-        self.constraint = self.bone.constraints.new("DAMPED_TRACK")
+        self.constraint = self.bone.constraints.new("DAMPED_TRACK") if self.bone else None
 
 
     def create_landmark(self) -> Object:
         """
         Creates a primitive_nurbs_surface_sphere visualizing the estimated position
         """
+        name = self.model.prefix + self.name
+
         # If an animation has already been applied the objects will be here
-        if self.name in bpy.data.objects:
-            return bpy.data.objects[self.name]
+        if name in bpy.data.objects:
+            return bpy.data.objects[name]
 
         bpy.ops.surface.primitive_nurbs_surface_sphere_add()
         ob = bpy.context.object
-        ob.name = self.name
+        ob.name = name
         ob.scale = Vector((0.02, 0.02, 0.02))
         return ob
 
@@ -98,7 +165,8 @@ class Joint:
         target_name: str
             The name of the joint the constraint should be targeted at
         """
-        self.constraint.target = self.model.joints[target_name].landmark
+        if self.constraint:
+            self.constraint.target = self.model.joints[target_name].landmark
     
 
     def connect(self, target_name: str) -> None:
@@ -138,14 +206,32 @@ class Model:
         bone->targeted-bone
     current_frame: int
         The current key_frame the animation is at
-    current_starting_translation: Vector
-        Since the application of successive sequences is possible, there needs to be a
-        starting translation for the current sequence for a fluid transition
+    clips: dict
+        The NLA-strips of every applied clip (clip-name->strips), one strip for the model
+        and one for each landmark
     previous_model_matrix: Matrix
         Since the application of successive sequences is possible, there needs to be a
         previous model matrix for the current sequence for a fluid transition
     DIST_FACTOR: float
         The factor the translation in the pose-estimated screen (0-1) is multiplied with
+    prefix: str
+        Prefix for the names of the landmarks, necessary if multiple models are animated
+        inside the same scene
+    joint_limits: dict
+        The anatomical ranges of the joints (see constraints.JOINT_LIMITS), None disables 
+        the constraint solver
+    segment_lengths: dict
+        The rest-pose distance between every landmarked bone and its targeted bone, only if baking
+    bake: bool
+        Indicates whether the ("DAMPED_TRACK") constraints are baked into pose-bone rotations
+        instead of being evaluated live
+    bone_order: list
+        The bones relevant for baking (tracking bones, landmarked bones and their parents), 
+        parents before their children
+    bone_parents: dict
+        The name of the parent of every bone of bone_order (None for root bones)
+    rest_matrices: dict
+        The rest matrix (Bone.matrix_local) of every bone of bone_order as array with the shape (4, 4)
 
     Methods
     -------
@@ -153,26 +239,59 @@ class Model:
         Creates joints according to the config
     set_mode(self, b_mode: Enum) -> None
         Sets the current blender mode
-    get_body_center(self, shoulderR, shoulderL, hipR, hipL, convert_func) -> Vector
-        Get the center of the estimated body by an average of right/left shoulder/hip
-    find_base(self, shoulderR: np.array, shoulderL: np.array, hipR: np.array, hipL: np.array) -> Matrix
-        Find the base of the estimated body by an average of right/left shoulder/hip as matrix
-    find_relative_translation(self, total_translation: Vector, distance_factor: float) -> Vector
-        Find the relative translation depending on the current_starting_translation
+    get_body_center(self, shoulderR, shoulderL, hipR, hipL, convert_func) -> np.ndarray
+        Get the center of the estimated body in every frame by an average of right/left shoulder/hip
+    find_base(self, shoulderR: np.array, shoulderL: np.array, hipR: np.array, hipL: np.array) -> np.ndarray
+        Find the base of the estimated body in every frame by an average of right/left shoulder/hip as matrices
+    find_relative_translation(self, absolute_translation: np.ndarray, distance_factor: float) -> np.ndarray
+        Find the translation of every frame relative to the first frame
     reset(self) -> None
         Reset the animation of the model and reset the current_frame/previous_model_matrix 
-    apply_animation(self, data: dict, convert_func, AVG_OVER_N: int) -> None
+    get_clip_actions(self, name: str, clear: bool) -> dict
+        Get or create the actions of a clip, one for the model and one for each landmark
+    place_strip(self, owner: Object, action: Action, frame_start: int, blend_in: int) -> NlaStrip
+        Place an action as NLA-strip on a new track on top of the owner's NLA-stack
+    move_clip(self, name: str, frame_start: int) -> None
+        Move all strips of an already applied clip to a new starting frame
+    apply_animation(self, data: landmarkSequence, convert_func, AVG_OVER_N: int, name: str, blend_in: int, use_cached: bool, clip: dict, frame_offset: int) -> None
         Apply the estimated coordinates to the model
+    place_clip(self, name: str, actions: dict, blend_in: int, frame_offset: int) -> None
+        Place the (already written) actions of a clip as NLA-strips at the current_frame
+    compute_clip(self, data: landmarkSequence, convert_func, AVG_OVER_N: int) -> dict
+        Compute the (averaged) model transformations and landmark directions of a clip
+    constrain(self, positions: dict) -> dict
+        Constrain the landmark positions of all frames to the joint limits
+    compute_rotations(self, clip: dict, landmarked: set) -> tuple
+        Compute the rotations of the tracking pose-bones and the positions of the landmarks
+    pose_frame(self, clip: dict, i: int, toggle_mode: bool) -> list
+        Pose the model and its landmarks like the i-th frame of a computed clip without inserting keyframes
+    missing_constraints(self, clip: dict, missing: bool) -> list
+        The constraints targeting landmarks which are not animated by a clip
+    write_clip(self, clip: dict, actions: dict) -> int
+        Write the keyframes of a computed clip into its actions, starting at frame 0
+    write_baked_clip(self, clip: dict, actions: dict) -> int
+        Write the keyframes of a computed clip (including the pose-bone rotations) in bulk into its actions
+    insert_keyframes(self, action: Action, data_path: str, frames: np.ndarray, values: np.ndarray, group: str) -> None
+        Insert the keyframes of all frames at once, replacing existing F-curves of the data_path
+    remove_landmarks(self) -> None
+        Remove the ("DAMPED_TRACK") constraints, the landmarks and their animations
     """
     model: Object
     armature: Armature
     landmark_parent: Object
-    joints = dict() 
+    joints: dict
     connections: dict
     current_frame: int
-    current_starting_translation: Vector
+    clips: dict
     previous_model_matrix: Matrix
     DIST_FACTOR: float
+    prefix: str
+    joint_limits: dict
+    segment_lengths: dict
+    bake: bool
+    bone_order: list
+    bone_parents: dict
+    rest_matrices: dict
 
 
     class BlenderMode(Enum):
@@ -183,7 +302,8 @@ class Model:
         POSE = 1
 
     
-    def __init__(self, connections: dict, model: Object, armature: Armature, DIST_FACTOR: float) -> None:
+    def __init__(self, connections: dict, model: Object, armature: Armature, DIST_FACTOR: float, prefix: str = "",
+                 joint_limits: dict = None, bake: bool = False) -> None:
         """
         Parameters
         ----------
@@ -196,23 +316,37 @@ class Model:
             A reference to the armature the animations should be applied
         DIST_FACTOR: float
             The factor the translation in the pose-estimated screen-space (0-1) is multiplied with
+        prefix: str = ""
+            Prefix for the names of the landmarks, necessary if multiple models are animated
+            inside the same scene
+        joint_limits: dict = None
+            The anatomical ranges of the joints (see constraints.JOINT_LIMITS), if given the 
+            landmarks are constrained to them
+        bake: bool = False
+            Write the rotations of the pose-bones as keyframes instead of relying on the
+            ("DAMPED_TRACK") constraints, which are muted
         """
         self.model: Object = model
         self.armature: Armature = armature
         self.current_frame: int = 0
+        self.clips = dict()
         self.previous_model_matrix = Matrix.Identity(4)
         self.connections = connections
         self.DIST_FACTOR = DIST_FACTOR
+        self.prefix = prefix
+        self.joint_limits = joint_limits
+        self.bake = bake
+        self.joints = dict()
 
         self.set_mode(self.BlenderMode.OBJECT)
 
         # If an animation has already been applied the objects will be here
-        if "Landmarks" in bpy.data.objects:
-            self.landmark_parent = bpy.data.objects["Landmarks"]
+        if prefix + "Landmarks" in bpy.data.objects:
+            self.landmark_parent = bpy.data.objects[prefix + "Landmarks"]
         else:
             bpy.ops.object.empty_add()
             self.landmark_parent = bpy.context.object
-            self.landmark_parent.name = "Landmarks"
+            self.landmark_parent.name = prefix + "Landmarks"
             self.landmark_parent.scale = Vector((10, 10, 10))
 
         # Only certain connections will be visualized with a landmark, others
@@ -220,12 +354,42 @@ class Model:
         self.create_joints(connections["landmarked"], True)
         self.create_joints(connections["rest"], False)
 
+        # Only needed for placing the landmarks when baking. Targets which are no bones (e.g. finger
+        # tips) are at the tail of the targeting bone
+        self.segment_lengths = {}
+        if bake:
+            self.segment_lengths = {
+                (bone_id, target_id): ((
+                    armature.bones[target_id].head_local if target_id in armature.bones else armature.bones[bone_id].tail_local
+                ) - armature.bones[bone_id].head_local).length
+                for bone_id, target_id in connections["landmarked"].items() if bone_id in armature.bones
+            }
+
         for joint_id, joint in self.joints.items():
             if joint_id in connections["landmarked"]:
                 joint.target(connections["landmarked"][joint_id])
                 joint.connect(connections["landmarked"][joint_id])
             elif joint_id in connections["rest"]:
                 joint.target(connections["rest"][joint_id])
+
+        # The rest pose of all bones which are needed to compute the rotations of the tracking bones
+        tracking = {**connections["landmarked"], **connections["rest"]}
+        relevant = (set(tracking.keys()) | set(tracking.values())) & set(armature.bones.keys())
+        for name in list(relevant):
+            relevant.update(parent.name for parent in armature.bones[name].parent_recursive)
+        self.bone_order = sorted(relevant, key=lambda name: len(armature.bones[name].parent_recursive))
+        self.bone_parents = {
+            name: armature.bones[name].parent.name if armature.bones[name].parent else None for name in relevant
+        }
+        self.rest_matrices = {name: np.array(armature.bones[name].matrix_local) for name in relevant}
+
+        if bake:
+            for joint in self.joints.values():
+                if joint.constraint is None:
+                    continue
+                joint.constraint.mute = True
+                if joint.name in tracking:
+                    joint.bone.rotation_mode = "QUATERNION"
             
 
     def create_joints(self, config: dict, create_landmarks: bool) -> None:
@@ -265,65 +429,62 @@ class Model:
             bpy.ops.object.mode_set(mode=b_mode.name, toggle=False)
 
     
-    def get_body_center(self, shoulderR: np.array, shoulderL: np.array, hipR: np.array, hipL: np.array, convert_func) -> Vector:
+    def get_body_center(self, shoulderR: np.array, shoulderL: np.array, hipR: np.array, hipL: np.array, convert_func) -> np.ndarray:
         """
-        Get the center of the estimated body by an average of right/left shoulder/hip
+        Get the center of the estimated body in every frame by an average of right/left shoulder/hip
 
         Parameters
         ----------
         shoulderR: np.array
-            Estimated position for the right shoulder
+            Estimated positions for the right shoulder with the shape (N, 3)
         shoulderL: np.array
-            Estimated position for the left shoulder
+            Estimated positions for the left shoulder with the shape (N, 3)
         hipR: np.array
-            Estimated position for the right hip
+            Estimated positions for the right hip with the shape (N, 3)
         hipL: np.array
-            Estimated position for the left hip
+            Estimated positions for the left hip with the shape (N, 3)
         convert_func: function
             The XYZ-format of pose-estimators might be different than blender,
             provide a conversion function
         """
-        return convert_func((shoulderR + shoulderL) / 2 + (hipR + hipL) / 2) / 2
+        return ((shoulderR + shoulderL) / 2 + (hipR + hipL) / 2) @ conversion_matrix(convert_func).T / 2
 
 
-    def find_base(self, shoulderR: np.array, shoulderL: np.array, hipR: np.array, hipL: np.array) -> Matrix:
+    def find_base(self, shoulderR: np.array, shoulderL: np.array, hipR: np.array, hipL: np.array) -> np.ndarray:
         """
-        Find the base of the estimated body by an average of right/left shoulder/hip as matrix
+        Find the base of the estimated body in every frame by an average of right/left shoulder/hip
+        as matrices (rows x, y, z) with the shape (N, 3, 3)
 
         Parameters
         ----------
         shoulderR: np.array
-            Estimated position for the right shoulder
+            Estimated positions for the right shoulder with the shape (N, 3)
         shoulderL: np.array
-            Estimated position for the left shoulder
+            Estimated positions for the left shoulder with the shape (N, 3)
         hipR: np.array
-            Estimated position for the right hip
+            Estimated positions for the right hip with the shape (N, 3)
         hipL: np.array
-            Estimated position for the left hip
+            Estimated positions for the left hip with the shape (N, 3)
         """
         base_x = ((shoulderL + hipL) / 2 - (shoulderR + hipR) / 2)
         base_z = ((shoulderR + shoulderL) / 2 - (hipR + hipL) / 2)
         base_y = np.cross(base_x, base_z)
-        
-        base = np.array([
-            base_x, base_y, base_z
-        ])
-                
-        return Matrix(base)
+
+        return np.stack([base_x, base_y, base_z], axis=1)
      
     
-    def find_relative_translation(self, absolute_translation: Vector, distance_factor: float) -> Vector:
+    def find_relative_translation(self, absolute_translation: np.ndarray, distance_factor: float) -> np.ndarray:
         """
-        Find the relative translation depending on the current_starting_translation
+        Find the translation of every frame relative to the first frame
 
         Parameters
         ----------
-        absolute_translation: Vector
-            The absoulute current translation
+        absolute_translation: np.ndarray
+            The absolute translations with the shape (N, 3)
         distance_factor: float
             The factor the screen space of the estimator (0-1) is multiplied
         """
-        return (absolute_translation - self.current_starting_translation) * distance_factor
+        return (absolute_translation - absolute_translation[0]) * distance_factor
 
 
     def reset(self) -> None:
@@ -331,6 +492,7 @@ class Model:
         Reset the animation of the model and reset the current_frame/previous_model_matrix 
         """
         self.current_frame = 0
+        self.clips = dict()
         self.previous_model_matrix = Matrix.Identity(4)
 
         self.model.animation_data_clear()
@@ -340,109 +502,522 @@ class Model:
                 joint.landmark.animation_data_clear()
 
 
-    def apply_animation(self, data: dict, convert_func, AVG_OVER_N: int) -> None: 
+    def get_clip_actions(self, name: str, clear: bool = True) -> dict:
         """
-        Apply the estimated coordinates to the model
+        Get or create the actions of a clip, one for the model and one for each landmark.
+        Blender actions are bound to a single object, thus every landmark needs its own
+        action, all of them are prefixed with the name of the clip
 
         Parameters
         ----------
-        data: dict
+        name: str
+            The name of the clip
+        clear: bool = True
+            Indicates whether already existing keyframes of the actions should be removed
+        """
+        owners = [self.model] + [joint.landmark for joint in self.joints.values() if joint.has_landmark]
+
+        actions = {}
+        for owner in owners:
+            action_name = "{}|{}".format(name, owner.name)
+            action = bpy.data.actions.get(action_name)
+            if action is None:
+                action = bpy.data.actions.new(action_name)
+            elif clear:
+                for fcurve in list(action.fcurves):
+                    action.fcurves.remove(fcurve)
+            actions[owner.name] = action
+
+        return actions
+
+
+    def place_strip(self, owner: Object, action: Action, frame_start: int, blend_in: int = 0) -> NlaStrip:
+        """
+        Place an action as NLA-strip on a new track on top of the owner's NLA-stack. Later 
+        clips lie above the earlier ones, such that they take over once they start while the 
+        earlier ones hold their last pose throughout the gaps
+
+        Parameters
+        ----------
+        owner: Object
+            The object the action is animating
+        action: Action
+            The action of the clip
+        frame_start: int
+            The frame the strip should start at
+        blend_in: int = 0
+            How many frames the strip should blend in over the previous one
+        """
+        anim_data = owner.animation_data or owner.animation_data_create()
+        anim_data.action = None
+
+        track = anim_data.nla_tracks.new()
+        track.name = action.name
+        strip = track.strips.new(action.name, int(frame_start), action)
+        strip.extend_mode = "HOLD_FORWARD"
+        strip.blend_in = blend_in
+
+        return strip
+
+
+    def move_clip(self, name: str, frame_start: int) -> None:
+        """
+        Move all strips of an already applied clip to a new starting frame, the keyframes
+        themselves stay untouched
+
+        Parameters
+        ----------
+        name: str
+            The name of the clip
+        frame_start: int
+            The new starting frame of the clip
+        """
+        for strip in self.clips[name]:
+            strip.frame_start_ui = frame_start
+
+
+    def apply_animation(self, data: "landmarkSequence", convert_func, AVG_OVER_N: int, name: str = None, 
+                        blend_in: int = 0, use_cached: bool = False, clip: dict = None,
+                        frame_offset: int = 0) -> None: 
+        """
+        Apply the estimated coordinates to the model. The clip is written into its own actions 
+        which are placed as NLA-strips at the current_frame
+
+        Parameters
+        ----------
+        data: landmarkSequence
             The data preprocessed by the mp_pose_preprocess.py script
         convert_func: function
             The XYZ-format of pose-estimators might be different than blender,
             provide a conversion function
         AVG_OVER_N: int
             Identifies how many estimated frames are averaged over
-        """         
-        self.current_starting_translation = self.get_body_center(
-            np.array(data[0]["shoulder01.R"]), np.array(data[0]["shoulder01.L"]),
-            np.array(data[0]["upperleg01.R"]), np.array(data[0]["upperleg01.L"]),
-            convert_func
-        )
-        
-        average_over_n_entries = {}
-        for i, entry in enumerate(data):
-            shoulderR, shoulderL = np.array(entry["shoulder01.R"]), np.array(entry["shoulder01.L"])
-            upperlegR, upperlegL = np.array(entry["upperleg01.R"]), np.array(entry["upperleg01.L"])
-
-            # Find the "spine"-rotation and apply it to the whole model
-            base = (self.find_base(
-                shoulderR, shoulderL, upperlegR, upperlegL
-            ))
-            base.resize_4x4()
-            euler_angles: Euler = base.to_euler()
-            euler_angles.x = 0
-            average_over_n_entries.setdefault("euler_angles",[]).append(euler_angles)
-
-            # Find the location of the mid-point between shoulders and hips and apply it to the model
-            translation = self.find_relative_translation(
-                self.get_body_center(shoulderR, shoulderL, upperlegR, upperlegL, convert_func), self.DIST_FACTOR)
-            average_over_n_entries.setdefault("model_location",[]).append(translation)
-
-            for bone_id, pos in entry.items():
-                # Not all bones as defined BODY_PARTS in the preprocessing steps are actually loaded joints
-                if bone_id in self.joints:
-                    if self.joints[bone_id].has_landmark:
-                        average_over_n_entries.setdefault(bone_id,[]).append(pos)
-            
-            # After AVG_OVER_N iterations or the end of the data calculate the avgs and apply them to the model
-            if i % AVG_OVER_N == 0 or i == len(data):
-                for id, vecs in average_over_n_entries.items():
-                    as_avg_array = np.array(list(map(lambda vec: np.array([vec[0] / AVG_OVER_N, vec[1] / AVG_OVER_N, vec[2] / AVG_OVER_N]), vecs)))
-                    avg = np.sum(as_avg_array, axis=0) 
-
-                    if id == "euler_angles":
-                        self.model.rotation_euler = Euler((avg[0], avg[1], avg[2]))
-                        self.model.keyframe_insert(data_path="rotation_euler", frame=self.current_frame)
-
-                        # Application of changes (somehow this is necessary so the changes are actually committed,
-                        # necessary for landmark-keyframes)
-                        self.set_mode(self.BlenderMode.OBJECT)
-                        self.set_mode(self.BlenderMode.POSE)
-                        self.set_mode(self.BlenderMode.OBJECT)
-
-                    elif id == "model_location":
-                        self.model.location = self.previous_model_matrix.translation + Vector((avg[0], avg[1], avg[2]))
-                        self.model.keyframe_insert(data_path="location", frame=self.current_frame)
-
-                        # Application of changes (somehow this is necessary so the changes are actually committed, 
-                        # necessary for landmark-keyframes)
-                        self.set_mode(self.BlenderMode.OBJECT)
-                        self.set_mode(self.BlenderMode.POSE)
-                        self.set_mode(self.BlenderMode.OBJECT)
-
-                    else:
-                        landmark: Object = self.joints[id].landmark
-
-                        # Find out whether the bone is targeted by another bone or not
-                        keys_as_list = list(self.connections["landmarked"].keys())
-                        vals_as_list = list(self.connections["landmarked"].values())
-                        targeted_by_id = keys_as_list[vals_as_list.index(id)] if id in vals_as_list else None
-                        
-                        # If the bone is being targeted, set the landmark position of the landmark such that it is placed
-                        # from the targeted (previous) bone to the current bone with the accurate length into the direction that 
-                        # the pose-estimator found
-                        if targeted_by_id:
-                            bone_head_targeted_by = self.model.matrix_world @ self.joints[targeted_by_id].bone.head
-                            bone_head_current = self.model.matrix_world @ self.joints[id].bone.head
-
-                            targeted_avg_arr = np.array(list(map(
-                                lambda vec: np.array([vec[0] / AVG_OVER_N, vec[1] / AVG_OVER_N, vec[2] / AVG_OVER_N]),
-                                average_over_n_entries[targeted_by_id])))
-                            direction = convert_func(avg - np.sum(targeted_avg_arr, axis=0))
-                            direction.normalize()
-
-                            landmark.location = bone_head_targeted_by + direction * (bone_head_targeted_by - bone_head_current).length
-                            landmark.location /= self.landmark_parent.scale[0]
-                        # Otherwise just set the landmark to the position of the current bone
-                        else:
-                            landmark.location = self.model.matrix_world @ self.joints[id].bone.head
-                            landmark.location /= self.landmark_parent.scale[0]
-
-                        landmark.keyframe_insert(data_path="location", frame=self.current_frame)
-                
-                average_over_n_entries = {}
-            self.current_frame += 1
+        name: str = None
+            The name of the clip, the actions are named after it
+        blend_in: int = 0
+            How many frames the clip should blend in over the previous one
+        use_cached: bool = False
+            Reuse the actions of a previously applied clip with the same name instead of
+            recomputing the keyframes
+        clip: dict = None
+            An already computed clip (see compute_clip), e.g. if the computation was run in parallel
+        frame_offset: int = 0
+            Frames after the current_frame the clip starts at (e.g. a person entering the scene later)
+        """
+        if name is None:
+            name = "Clip{}".format(len(self.clips))
+
+        # Only if every action of the clip still exists (e.g. not after remove_landmarks), otherwise
+        # missing landmark actions would silently be created empty
+        owners = [self.model] + [joint.landmark for joint in self.joints.values() if joint.has_landmark]
+        cached = use_cached and all("{}|{}".format(name, owner.name) in bpy.data.actions for owner in owners)
+        actions = self.get_clip_actions(name, clear=not cached)
+
+        if not cached:
+            if clip is None:
+                clip = self.compute_clip(data, convert_func, AVG_OVER_N)
+            self.write_clip(clip, actions)
+
+        self.place_clip(name, actions, blend_in, frame_offset)
+
+
+    def place_clip(self, name: str, actions: dict, blend_in: int = 0, frame_offset: int = 0) -> None:
+        """
+        Place the (already written) actions of a clip as NLA-strips at the current_frame and
+        advance the current_frame by the length of the clip
+
+        Parameters
+        ----------
+        name: str
+            The name of the clip
+        actions: dict
+            The actions of the clip (object-name->action), e.g. as returned by get_clip_actions
+            or loaded from the output of another blender process
+        blend_in: int = 0
+            How many frames the clip should blend in over the previous one
+        frame_offset: int = 0
+            Frames after the current_frame the clip starts at
+        """
+        model_action = actions[self.model.name]
+
+        # Successive clips continue from the last location of this one
+        location = self.previous_model_matrix.translation.copy()
+        for index in range(3):
+            fcurve = model_action.fcurves.find("location", index=index)
+            if fcurve:
+                location[index] = fcurve.evaluate(model_action.frame_range[1])
+        self.previous_model_matrix = Matrix.Translation(location)
+
+        self.clips[name] = [
+            self.place_strip(bpy.data.objects[owner_name], action, self.current_frame + frame_offset, blend_in)
+            for owner_name, action in actions.items()
+        ]
+        self.current_frame += model_action.get("length", int(model_action.frame_range[1]) + 1) + frame_offset
+
+
+    def compute_clip(self, data: "landmarkSequence", convert_func, AVG_OVER_N: int) -> dict:
+        """
+        Compute the (averaged) model transformations and landmark directions of a clip. 
+        Operates on whole arrays and does not touch any blender data, thus it is safe to 
+        compute multiple clips (e.g. one per tracked person) in parallel
+
+        Parameters
+        ----------
+        data: landmarkSequence
+            The data preprocessed by the mp_pose_preprocess.py script, the positions of the
+            joints are used as views without copying them. The keyframes are placed at the
+            video-frames of the sequence (data.frames), e.g. if the person was not detected
+            throughout the whole video
+        convert_func: function
+            The XYZ-format of pose-estimators might be different than blender,
+            provide a conversion function
+        AVG_OVER_N: int
+            Identifies how many estimated frames are averaged over
+        """
+        frames = data.frames - data.frames[0]
+        conversion = conversion_matrix(convert_func)
+
+        # Not all bones as defined BODY_PARTS in the preprocessing steps are actually loaded joints
+        landmarked = set(self.connections["landmarked"].keys()) | set(self.connections["landmarked"].values())
+        positions = {
+            bone_id: fill_missing(data.joint(bone_id))
+            for bone_id in self.joints if bone_id in landmarked and bone_id in data.index
+        }
+        # Landmarks which are not part of the clip at all (e.g. hands out of view) are not animated
+        positions = {bone_id: pos for bone_id, pos in positions.items() if pos is not None}
+        for bone_id in ["shoulder01.R", "shoulder01.L", "upperleg01.R", "upperleg01.L"]:
+            if bone_id not in positions:
+                positions[bone_id] = data.joint(bone_id)
+        shoulderR, shoulderL = positions["shoulder01.R"], positions["shoulder01.L"]
+        upperlegR, upperlegL = positions["upperleg01.R"], positions["upperleg01.L"]
+
+        # Find the "spine"-rotation of every frame
+        euler_angles = matrices_to_euler(self.find_base(shoulderR, shoulderL, upperlegR, upperlegL))
+        euler_angles[:, 0] = 0
+
+        # Find the location of the mid-point between shoulders and hips, relative to the first frame
+        translation = self.find_relative_translation(
+            self.get_body_center(shoulderR, shoulderL, upperlegR, upperlegL, convert_func), self.DIST_FACTOR)
+
+        # After AVG_OVER_N entries the averages are keyframed, the first entry on its own,
+        # an incomplete group at the end is dropped. Every group is divided by its own size, the
+        # original loop divided the first (single) entry by AVG_OVER_N as well, which scaled the
+        # first rotation and location keyframe of every clip down
+        keyed = np.arange(0, len(data), AVG_OVER_N)
+        starts = np.concatenate([[0], keyed[:-1] + 1])
+        counts = np.diff(np.concatenate([starts, [keyed[-1] + 1]]))[:, None]
+
+        def average(values: np.ndarray) -> np.ndarray:
+            return np.add.reduceat(values[:keyed[-1] + 1], starts, axis=0) / counts
+
+        converted = {bone_id: pos @ conversion.T for bone_id, pos in positions.items()}
+        if self.joint_limits is not None:
+            converted = self.constrain(converted)
+
+        averages = {bone_id: average(pos) for bone_id, pos in converted.items()}
+        targeted_by = {target: bone_id for bone_id, target in reversed(list(self.connections["landmarked"].items()))}
+
+        # Direction from the targeting (previous) landmark to the current one, as found by the pose-estimator
+        directions = {}
+        for bone_id in positions:
+            if bone_id in landmarked and targeted_by.get(bone_id) in positions:
+                direction = averages[bone_id] - averages[targeted_by[bone_id]]
+                directions[bone_id] = direction / np.linalg.norm(direction, axis=1, keepdims=True)
+
+        clip = {
+            "frames": frames[keyed],
+            "length": int(frames[-1]) + 1,
+            "euler_angles": average(euler_angles),
+            "model_location": average(translation),
+            "directions": directions,
+            "targeted_by": targeted_by,
+            # Landmarks which are not animated by this clip, the constraints targeting them are turned off
+            "missing": landmarked - set(positions),
+        }
+        if self.bake:
+            clip["rotations"], clip["landmark_positions"] = self.compute_rotations(clip, landmarked)
+
+        return clip
+
+
+    def compute_rotations(self, clip: dict, landmarked: set) -> tuple:
+        """
+        Compute the rotations of the tracking pose-bones and the positions of the landmarks 
+        (both in armature space) of a computed clip, as the ("DAMPED_TRACK") constraints would 
+        evaluate them
+
+        Parameters
+        ----------
+        clip: dict
+            The clip as computed by compute_clip
+        landmarked: set
+            The names of all landmarked joints
+        """
+        directions, targeted_by = clip["directions"], clip["targeted_by"]
+        # The directions are found in world space, the armature is rotated with the model
+        inverse_model_rotations = np.swapaxes(baking.euler_to_matrices(clip["euler_angles"]), 1, 2)
+        landmark_positions = {}
+
+        def target_position(target: str, heads: dict) -> np.ndarray:
+            if target not in landmark_positions:
+                # The landmark is placed from the targeted (previous) bone into the estimated direction
+                if target in directions:
+                    source = targeted_by[target]
+                    direction = (inverse_model_rotations @ directions[target][..., None])[..., 0]
+                    landmark_positions[target] = heads[source] + direction * self.segment_lengths[(source, target)]
+                else:
+                    # A landmark which is not targeted sits at the head of its bone
+                    landmark_positions[target] = heads[target]
+            return landmark_positions[target]
+
+        # Only targets with a position can be tracked: estimated directions or the heads of bones
+        # posed before the tracking bone. Bones targeting landmarks missing from the clip keep
+        # their rest rotation, like their muted constraints do without baking
+        order = {name: i for i, name in enumerate(self.bone_order)}
+        tracking = {
+            bone_id: target for bone_id, target in {**self.connections["landmarked"], **self.connections["rest"]}.items()
+            if target in directions or (
+                target not in clip["missing"] and target in order and order[target] < order[bone_id])
+        }
+        rotations, heads = baking.bone_rotations(
+            self.bone_order, self.bone_parents, self.rest_matrices, tracking, target_position)
+
+        for bone_id in landmarked:
+            if bone_id in directions or bone_id in heads:
+                target_position(bone_id, heads)
+        return rotations, landmark_positions
+
+
+    def constrain(self, positions: dict) -> dict:
+        """
+        Constrain the (converted) landmark positions of all frames to the joint limits. The
+        lengths of the segments are not constrained, the landmarks are placed by the directions
+        only and the lengths are given by the rig
+
+        Parameters
+        ----------
+        positions: dict
+            The converted positions of every landmark (bone->array with the shape (N, 3))
+        """
+        return constraints.solve(positions, self.connections["landmarked"], self.joint_limits)
+
+
+    def pose_frame(self, clip: dict, i: int, toggle_mode: bool = True) -> list:
+        """
+        Pose the model and its landmarks like the i-th frame of a computed clip without inserting
+        keyframes, returns the landmarks which were placed
+
+        Parameters
+        ----------
+        clip: dict
+            The clip as returned by compute_clip
+        i: int
+            The index of the frame inside of the clip
+        toggle_mode: bool = True
+            Commit the transformation of the model by toggling the mode, otherwise only the view
+            layer is updated (cheaper, but not sufficient for landmark-keyframes)
+        """
+        targeted_by = clip["targeted_by"]
+
+        self.model.rotation_euler = Euler(clip["euler_angles"][i])
+        self.model.location = self.previous_model_matrix.translation + Vector(clip["model_location"][i])
+
+        # Baked models have muted constraints, thus their bones are rotated directly
+        for bone_id, rotations in clip.get("rotations", {}).items():
+            self.model.pose.bones[bone_id].rotation_quaternion = rotations[i]
+
+        # Bones targeting landmarks which are not animated (e.g. hands out of view) keep their pose
+        for constraint in self.missing_constraints(clip):
+            constraint.influence = 0.0
+        for constraint in self.missing_constraints(clip, missing=False):
+            constraint.influence = 1.0
+
+        # Application of changes (somehow this is necessary so the changes are actually committed,
+        # necessary for landmark-keyframes)
+        if toggle_mode:
+            self.set_mode(self.BlenderMode.OBJECT)
+            self.set_mode(self.BlenderMode.POSE)
+            self.set_mode(self.BlenderMode.OBJECT)
+        else:
+            bpy.context.view_layer.update()
+
+        posed = []
+        for id, joint in self.joints.items():
+            if not joint.has_landmark:
+                continue
+            landmark: Object = joint.landmark
+
+            # If the bone is being targeted, set the landmark position of the landmark such that it is placed
+            # from the targeted (previous) bone to the current bone with the accurate length into the direction that 
+            # the pose-estimator found
+            if id in clip["directions"]:
+                bone_head_targeted_by = self.model.matrix_world @ self.joints[targeted_by[id]].bone.head
+                # Joints without a bone (e.g. finger tips) are at the tail of the targeting bone
+                bone_head_current = self.model.matrix_world @ (
+                    joint.bone.head if joint.bone else self.joints[targeted_by[id]].bone.tail)
+
+                direction = Vector(clip["directions"][id][i])
+                landmark.location = bone_head_targeted_by + direction * (bone_head_targeted_by - bone_head_current).length
+                landmark.location /= self.landmark_parent.scale[0]
+            # Otherwise just set the landmark to the position of the current bone
+            elif joint.bone:
+                landmark.location = self.model.matrix_world @ joint.bone.head
+                landmark.location /= self.landmark_parent.scale[0]
+            else:
+                continue
+
+            posed.append(landmark)
+
+        return posed
+
+
+    def missing_constraints(self, clip: dict, missing: bool = True) -> list:
+        """
+        The ("DAMPED_TRACK") constraints targeting landmarks which are not animated by a clip 
+        (or, with missing=False, the ones targeting animated landmarks), none if baking
+
+        Parameters
+        ----------
+        clip: dict
+            The clip as returned by compute_clip
+        missing: bool = True
+            Whether the constraints of the missing or of the animated landmarks are returned
+        """
+        return [
+            self.joints[bone_id].constraint
+            for bone_id, target in {**self.connections["landmarked"], **self.connections["rest"]}.items()
+            if self.joints[bone_id].constraint and not self.bake and (target in clip["missing"]) == missing
+        ]
+
+
+    def write_clip(self, clip: dict, actions: dict) -> int:
+        """
+        Write the keyframes of a computed clip into its actions, starting at frame 0, returns 
+        the length of the clip in frames
+
+        Parameters
+        ----------
+        clip: dict
+            The clip as returned by compute_clip
+        actions: dict
+            The actions of the clip as returned by get_clip_actions
+        """
+        if self.bake:
+            return self.write_baked_clip(clip, actions)
+
+        for owner_name, action in actions.items():
+            owner = bpy.data.objects[owner_name]
+            anim_data = owner.animation_data or owner.animation_data_create()
+            anim_data.action = action
+
+        for i, frame in enumerate(clip["frames"]):
+            frame = int(frame)
+            posed = self.pose_frame(clip, i)
+
+            # The influences are constant throughout the clip, but have to be part of its actions
+            if i == 0:
+                for constraint in self.missing_constraints(clip) + self.missing_constraints(clip, missing=False):
+                    constraint.keyframe_insert(data_path="influence", frame=frame)
+
+            self.model.keyframe_insert(data_path="rotation_euler", frame=frame)
+            self.model.keyframe_insert(data_path="location", frame=frame)
+            for landmark in posed:
+                landmark.keyframe_insert(data_path="location", frame=frame)
         
         # Shallow copy is necessary
-        self.previous_model_matrix = copy.copy(self.model.matrix_local)
\ No newline at end of file
+        self.previous_model_matrix = copy.copy(self.model.matrix_local)
+
+        # Keep the length of the clip along with the action (the last frames might not be keyframed)
+        actions[self.model.name]["length"] = clip["length"]
+        return clip["length"]
+
+
+    def write_baked_clip(self, clip: dict, actions: dict) -> int:
+        """
+        Write the keyframes of a computed clip (including the pose-bone rotations) in bulk into 
+        its actions, starting at frame 0, returns the length of the clip in frames
+
+        Parameters
+        ----------
+        clip: dict
+            The clip as returned by compute_clip
+        actions: dict
+            The actions of the clip as returned by get_clip_actions
+        """
+        frames = clip["frames"]
+        model_action = actions[self.model.name]
+
+        location = np.array(self.previous_model_matrix.translation) + clip["model_location"]
+        self.insert_keyframes(model_action, "location", frames, location, "Object Transforms")
+        self.insert_keyframes(model_action, "rotation_euler", frames, clip["euler_angles"], "Object Transforms")
+        for bone_id, rotations in clip["rotations"].items():
+            self.insert_keyframes(model_action, 'pose.bones["{}"].rotation_quaternion'.format(bone_id), frames, rotations, bone_id)
+
+        # The landmarks are only kept for visualization, from armature into world space
+        model_rotations = baking.euler_to_matrices(clip["euler_angles"])
+        scale = np.array(self.model.scale)
+        for bone_id, joint in self.joints.items():
+            if joint.has_landmark and bone_id in clip["landmark_positions"]:
+                world = (model_rotations @ (clip["landmark_positions"][bone_id] * scale)[..., None])[..., 0] + location
+                self.insert_keyframes(actions[joint.landmark.name], "location", frames, world / self.landmark_parent.scale[0])
+
+        self.previous_model_matrix = Matrix.Translation(Vector(location[-1]))
+
+        model_action["length"] = clip["length"]
+        return clip["length"]
+
+
+    def insert_keyframes(self, action: Action, data_path: str, frames: np.ndarray, values: np.ndarray, group: str = "") -> None:
+        """
+        Insert the keyframes of all frames at once, replacing existing F-curves of the data_path
+
+        Parameters
+        ----------
+        action: Action
+            The action the keyframes are inserted into
+        data_path: str
+            The animated property, e.g. "location"
+        frames: np.ndarray
+            The frames of the keyframes with the shape (N)
+        values: np.ndarray
+            The values of the property with the shape (N, number of components)
+        group: str = ""
+            The group the F-curves are put into
+        """
+        for index in range(values.shape[1]):
+            fcurve = action.fcurves.find(data_path, index=index)
+            if fcurve:
+                action.fcurves.remove(fcurve)
+
+            fcurve = action.fcurves.new(data_path, index=index, action_group=group)
+            fcurve.keyframe_points.add(len(frames))
+            fcurve.keyframe_points.foreach_set("co", np.column_stack([frames, values[:, index]]).astype(np.float32).ravel())
+            fcurve.update()
+
+
+    def remove_landmarks(self) -> None:
+        """
+        Remove the ("DAMPED_TRACK") constraints, the landmarks and their animations, 
+        only sensible after the clips were baked
+        """
+        landmark_actions = set()
+        for name, strips in self.clips.items():
+            landmark_actions.update(strip.action for strip in strips if strip.id_data != self.model)
+            self.clips[name] = [strip for strip in strips if strip.id_data == self.model]
+
+        for joint in self.joints.values():
+            if joint.constraint:
+                joint.bone.constraints.remove(joint.constraint)
+                joint.constraint = None
+            if joint.has_landmark:
+                bpy.data.objects.remove(joint.landmark)
+                joint.landmark = None
+                joint.has_landmark = False
+
+        # The ("<clip>|<landmark>") actions would otherwise be left orphaned and reused by later clips
+        for action in landmark_actions:
+            bpy.data.actions.remove(action)
+
+        if self.landmark_parent:
+            bpy.data.objects.remove(self.landmark_parent)
+            self.landmark_parent = None
@@ -1,8 +1,14 @@
+from typing import TYPE_CHECKING
 from bpy.types import Object
 from mathutils import Vector
 import numpy as np
 import bpy
 
+from .util import conversion_matrix
+
+if TYPE_CHECKING:
+    from preprocess.landmarks import landmarkSequence
+
 
 class Joint:
     """
@@ -96,11 +102,11 @@ class Plain:
     -------
     create_joints(self, config: dict, create_landmarks: bool) -> None
         Creates joints according to the config
-    get_body_center(self, shoulderR: np.array, shoulderL: np.array, hipR: np.array, hipL: np.array, convert_func) -> Vector
+    get_body_center(self, shoulderR: np.array, shoulderL: np.array, hipR: np.array, hipL: np.array) -> np.array
         Get the center of the estimated body by an average of right/left shoulder/hip
-    find_translation(self, shoulderR: np.array, shoulderL: np.array, convert_func) -> Vector
+    find_translation(self, shoulderR: np.array, shoulderL: np.array) -> np.array
         Find the absolute translation depending on the shoulders
-    apply_animation(self, data: dict, convert_func, AVG_OVER_N: int) -> None
+    apply_animation(self, data: landmarkSequence, convert_func) -> None
         Apply the estimated coordinates to the model
     """
     landmark_parent: Object
@@ -138,79 +144,66 @@ class Plain:
                 self.joints[connection_id].landmark.parent = self.landmark_parent
 
 
-    def get_body_center(self, shoulderR: np.array, shoulderL: np.array, hipR: np.array, hipL: np.array, convert_func) -> Vector:
+    def get_body_center(self, shoulderR: np.array, shoulderL: np.array, hipR: np.array, hipL: np.array) -> np.array:
         """
         Get the center of the estimated body by an average of right/left shoulder/hip
 
         Parameters
         ----------
         shoulderR: np.array
-            Estimated position for the right shoulder
+            (Converted) estimated positions for the right shoulder with the shape (N, 3)
         shoulderL: np.array
-            Estimated position for the left shoulder
+            (Converted) estimated positions for the left shoulder with the shape (N, 3)
         hipR: np.array
-            Estimated position for the right hip
+            (Converted) estimated positions for the right hip with the shape (N, 3)
         hipL: np.array
-            Estimated position for the left hip
-        convert_func: function
-            The XYZ-format of pose-estimators might be different than blender,
-            provide a conversion function
+            (Converted) estimated positions for the left hip with the shape (N, 3)
         """
-        adjustment_vec = ((shoulderR + shoulderL) / 2 + (hipR + hipL) / 2) / 2
-        return convert_func(adjustment_vec)
+        return ((shoulderR + shoulderL) / 2 + (hipR + hipL) / 2) / 2
 
 
-    def find_translation(self, shoulderR: np.array, shoulderL: np.array, convert_func) -> Vector:
+    def find_translation(self, shoulderR: np.array, shoulderL: np.array) -> np.array:
         """
         Find the absolute translation depending on the shoulders
 
         Parameters
         ----------
         shoulderR: np.array
-            Estimated position for the right shoulder
+            (Converted) estimated positions for the right shoulder with the shape (N, 3)
         shoulderL: np.array
-            Estimated position for the left shoulder
-        convert_func: function
-            The XYZ-format of pose-estimators might be different than blender,
-            provide a conversion function
+            (Converted) estimated positions for the left shoulder with the shape (N, 3)
         """
-        return convert_func((shoulderL + shoulderR) / 2)
+        return (shoulderL + shoulderR) / 2
 
 
-    def apply_animation(self, data: dict, convert_func) -> None:
+    def apply_animation(self, data: "landmarkSequence", convert_func) -> None:
         """
         Apply the estimated coordinates to the model
 
         Parameters
         ----------
-        data: dict
+        data: landmarkSequence
             The data preprocessed by the mp_pose_preprocess.py script
         convert_func: function
             The XYZ-format of pose-estimators might be different than blender,
             provide a conversion function
         """   
-        current_frame = 0
-        for entry in data:
-            for bone_id, pos in entry.items():
-                if bone_id in self.joints:
-                    landmark = self.joints[bone_id].landmark
-
-                    # Find location by the position (different system in blender) minus an adjustment
-                    # to the origin
-                    adjustment_vec = self.get_body_center(
-                        np.array(entry["shoulder01.R"]), np.array(entry["shoulder01.L"]),
-                        np.array(entry["upperleg01.R"]), np.array(entry["upperleg01.L"]),
-                        convert_func
-                    )
-                    self.landmark_parent.location = self.find_translation(
-                        np.array(entry["shoulder01.R"]), np.array(entry["shoulder01.L"]),
-                        convert_func
-                    )
-                    landmark.location = convert_func(pos) - adjustment_vec
-                    #landmark.location.normalize()
-                    
-                    self.landmark_parent.keyframe_insert(data_path="location", frame=current_frame)
-                    landmark.keyframe_insert(data_path="location", frame=current_frame)                   
-            
-            current_frame += 1
-
+        # All frames are converted at once (different system in blender)
+        positions = data.data @ conversion_matrix(convert_func).T
+        found = ~np.isnan(positions[:, :, 0])
+        shoulderR, shoulderL = positions[:, data.index["shoulder01.R"]], positions[:, data.index["shoulder01.L"]]
+        hipR, hipL = positions[:, data.index["upperleg01.R"]], positions[:, data.index["upperleg01.L"]]
+
+        # Location by the position minus an adjustment to the origin
+        adjustment = self.get_body_center(shoulderR, shoulderL, hipR, hipL)
+        translation = self.find_translation(shoulderR, shoulderL)
+        slots = [(self.joints[bone_id].landmark, data.index[bone_id]) for bone_id in self.joints if bone_id in data.index]
+
+        for current_frame in range(len(data)):
+            self.landmark_parent.location = translation[current_frame]
+            self.landmark_parent.keyframe_insert(data_path="location", frame=current_frame)
+
+            for landmark, slot in slots:
+                if found[current_frame, slot]:
+                    landmark.location = positions[current_frame, slot] - adjustment[current_frame]
+                    landmark.keyframe_insert(data_path="location", frame=current_frame)
@@ -1,4 +1,6 @@
 from mathutils import Vector
+from functools import lru_cache
+import numpy as np
 
 
 def gd_to_blender(vec) -> Vector:
@@ -7,4 +9,20 @@ def gd_to_blender(vec) -> Vector:
 
 # For some reason the z-axis (vec[2]) from mediapipe has way too much impact, thus dividing by 4
 def mp_to_blender(vec) -> Vector:
-    return Vector((vec[0], vec[2] / 4, -vec[1]))
\ No newline at end of file
+    return Vector((vec[0], vec[2] / 4, -vec[1]))
+
+
+@lru_cache()
+def conversion_matrix(convert_func) -> np.ndarray:
+    """
+    Express a (linear) conversion function as 3x3 matrix, such that whole arrays of 
+    positions (e.g. views into a landmarkSequence) can be converted at once via 
+    ``positions @ matrix.T``. The matrix is cached per function and must not be modified
+
+    Parameters
+    ----------
+    convert_func: function
+        The XYZ-format of pose-estimators might be different than blender,
+        provide a conversion function
+    """
+    return np.array([np.array(convert_func(axis)) for axis in np.eye(3)]).T
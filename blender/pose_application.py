@@ -1,8 +1,17 @@
 import bpy
+import os
+import sys
 import json
-import importlib.util
+from concurrent.futures import ThreadPoolExecutor
 
-PATH_PREFIX = "C:/Users/Mathias/Sync/Master/sem2/P1/implementations/pose-estimation/"
+# The root of this repository, e.g. "C:/sem2/P1/implementations/pose-estimation/". If empty, it is derived
+# from the location of this script, which only works if it is run from disk (inside of blender's text
+# editor __file__ points to the text inside of the .blend file)
+PATH_PREFIX = ""
+if not PATH_PREFIX:
+    if not os.path.isfile(__file__):
+        raise RuntimeError("PATH_PREFIX has to be set if pose_application.py is not run from the repository on disk")
+    PATH_PREFIX = os.path.dirname(os.path.dirname(os.path.abspath(__file__))).replace("\\", "/") + "/"
 MODEL_NAME = "Standard"
 DATA_PATHS = [
             PATH_PREFIX + "preprocess/output/walking.json",
@@ -12,6 +21,19 @@ DATA_PATHS = [
 DISTANCE_FACTOR = 20
 AVG_OVER_N_FRAMES = 3
 FRAMES_BETWEEN = [5, 5]
+USE_CACHED_CLIPS = False
+# Multi-person jsons (mp_multi_pose_preprocess.py) drive one model per track, the longest tracks first
+MULTI_PERSON = False
+TRACK_MODEL_NAMES = ["Standard", "Standard.001"]
+# Opt-in: constrain the landmarks to anatomical joint ranges (changes the output of existing clips)
+USE_JOINT_LIMITS = False
+# Bake the ("DAMPED_TRACK") constraints into pose-bone rotation keyframes, optionally removing the landmarks
+BAKE_CONSTRAINTS = False
+REMOVE_LANDMARKS = False
+# Pose the model in real time by the landmarks published by preprocess/live.py instead of applying DATA_PATHS
+LIVE = False
+LIVE_PORT = 9999
+LIVE_SMOOTHING = 0.5
 CONNECTIONS = {
     "landmarked": {
         "lowerarm01.L":	"wrist.L",
@@ -44,34 +66,127 @@ CONNECTIONS = {
     }
 }
 
-spec = importlib.util.spec_from_file_location("module.name", PATH_PREFIX + "blender/libs/model.py")
-m = importlib.util.module_from_spec(spec)
-spec.loader.exec_module(m)
+# Landmark subsets of the holistic preprocessing (--subsets) driving the model as well, e.g. ["hands", "face"]
+HOLISTIC_SUBSETS = []
+HOLISTIC_CONNECTIONS = {
+    # finger1-1 -> finger1-2 -> finger1-3 -> finger1-tip (the tips are no bones, only landmarks)
+    "hands": {
+        "finger{}-{}.{}".format(finger, joint, side): 
+            "finger{}-{}.{}".format(finger, joint + 1, side) if joint < 3 else "finger{}-tip.{}".format(finger, side)
+        for side in ("L", "R") for finger in range(1, 6) for joint in range(1, 4)
+    },
+    "face": {
+        "head": "HeadTop",
+    },
+}
+
+
+def use_holistic_subsets(subsets: list) -> None:
+    for subset in subsets:
+        CONNECTIONS["landmarked"].update(HOLISTIC_CONNECTIONS[subset])
+
+
+use_holistic_subsets(HOLISTIC_SUBSETS)
+
+if PATH_PREFIX not in sys.path:
+    sys.path.insert(0, PATH_PREFIX)
+
+from blender.libs import constraints
+from blender.libs import live
+from blender.libs import model as m
+from blender.libs import plain as p
+from blender.libs import util
+from preprocess.landmarks import landmarkSequence
+
+def load_data(paths: list) -> list:
+    data_dicts = []
+    for path in paths:
+        with open(path, "rt") as file:
+            data_dicts.append(json.loads(file.read()))
+    return data_dicts
+
 
-spec2 = importlib.util.spec_from_file_location("module.name", PATH_PREFIX + "blender/libs/plain.py")
-p = importlib.util.module_from_spec(spec2)
-spec2.loader.exec_module(p)
+def clip_name(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
 
-spec = importlib.util.spec_from_file_location("module.name", PATH_PREFIX + "blender/libs/util.py")
-util = importlib.util.module_from_spec(spec)
-spec.loader.exec_module(util)
 
-data_dicts = []
-for path in DATA_PATHS:
-    with open(path, "rt") as file:
-        data_dicts.append(json.loads(file.read()))
+def apply_multi_person(data_paths: list, track_model_names: list, distance_factor: float = DISTANCE_FACTOR,
+                       avg_over_n_frames: int = AVG_OVER_N_FRAMES, frames_between: list = FRAMES_BETWEEN) -> list:
+    models = [
+        m.Model(CONNECTIONS, bpy.data.objects[name], bpy.data.armatures[name], distance_factor, name + ".",
+                constraints.JOINT_LIMITS if USE_JOINT_LIMITS else None, BAKE_CONSTRAINTS)
+        for name in track_model_names
+    ]
+    for model in models:
+        model.reset()
 
+    for (i, data_dict) in enumerate(load_data(data_paths)):
+        tracks = [landmarkSequence.fromPoses(track["poses"], data_dict["bones"], track["frames"])
+                  for track in data_dict["tracks"].values()]
+        tracks = sorted(tracks, key=len, reverse=True)[:len(models)]
 
-model1 = m.Model(CONNECTIONS, bpy.data.objects[MODEL_NAME], bpy.data.armatures[MODEL_NAME], DISTANCE_FACTOR)
-model1.reset()
-#plain = p.Plain(CONNECTIONS)
-for (i, data_dict) in enumerate(data_dicts): 
-    data = data_dict["poses"]
+        # The retargeting of every track is computed in parallel, only writing the keyframes has to be sequential
+        with ThreadPoolExecutor() as pool:
+            clips = list(pool.map(
+                lambda model_track: model_track[0].compute_clip(model_track[1], util.mp_to_blender, avg_over_n_frames),
+                zip(models, tracks)
+            ))
 
-    model1.apply_animation(data, util.mp_to_blender, AVG_OVER_N_FRAMES)
+        start_frame = max(model.current_frame for model in models)
+        for model, track, clip in zip(models, tracks, clips):
+            model.current_frame = start_frame
+            model.apply_animation(track, util.mp_to_blender, avg_over_n_frames, clip_name(data_paths[i]),
+                                  clip=clip, frame_offset=int(track.frames[0]))
+            if not len(frames_between) - 1 < i:
+                model.current_frame += max(0, frames_between[i])
+
+    if BAKE_CONSTRAINTS and REMOVE_LANDMARKS:
+        for model in models:
+            model.remove_landmarks()
+
+    return models
+
+
+def apply_clips(data_paths: list, model_name: str = MODEL_NAME, distance_factor: float = DISTANCE_FACTOR,
+                avg_over_n_frames: int = AVG_OVER_N_FRAMES, frames_between: list = FRAMES_BETWEEN,
+                use_cached: bool = USE_CACHED_CLIPS, bake: bool = BAKE_CONSTRAINTS, remove_landmarks: bool = REMOVE_LANDMARKS):
+    model1 = m.Model(CONNECTIONS, bpy.data.objects[model_name], bpy.data.armatures[model_name], distance_factor,
+                     joint_limits=constraints.JOINT_LIMITS if USE_JOINT_LIMITS else None, bake=bake)
+    model1.reset()
+    #plain = p.Plain(CONNECTIONS)
+    blend_in = 0
+    for (i, data_dict) in enumerate(load_data(data_paths)): 
+        data = landmarkSequence.fromPoses(data_dict["poses"], data_dict["bones"])
+
+        model1.apply_animation(data, util.mp_to_blender, avg_over_n_frames, clip_name(data_paths[i]), blend_in, use_cached)
     
-    if not len(FRAMES_BETWEEN) - 1 < i:
-        model1.current_frame += FRAMES_BETWEEN[i]
+        # Positive values leave a gap between the clips, negative values let the next clip blend in
+        blend_in = 0
+        if not len(frames_between) - 1 < i:
+            model1.current_frame += frames_between[i]
+            blend_in = max(0, -frames_between[i])
+
+        #plain.apply_animation(data, util.mp_to_blender)
+
+    if bake and remove_landmarks:
+        model1.remove_landmarks()
+
+    return model1
+
+
+def apply_live(model_name: str = MODEL_NAME, distance_factor: float = DISTANCE_FACTOR, port: int = LIVE_PORT,
+               smoothing: float = LIVE_SMOOTHING, bake: bool = BAKE_CONSTRAINTS):
+    model = m.Model(CONNECTIONS, bpy.data.objects[model_name], bpy.data.armatures[model_name], distance_factor,
+                    joint_limits=constraints.JOINT_LIMITS if USE_JOINT_LIMITS else None, bake=bake)
+    model.reset()
+    live.start(model, util.mp_to_blender, port, smoothing)
+    return model
+
 
-    #plain.apply_animation(data, util.mp_to_blender)
-    
\ No newline at end of file
+if __name__ == "__main__":
+    if LIVE:
+        apply_live()
+    elif MULTI_PERSON:
+        apply_multi_person(DATA_PATHS, TRACK_MODEL_NAMES)
+    else:
+        apply_clips(DATA_PATHS)
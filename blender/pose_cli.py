@@ -0,0 +1,141 @@
+"""
+Headless entry point for the pose application, e.g.:
+
+    blender scene.blend --background --python blender/pose_cli.py -- \
+        --clips preprocess/output/walking.json preprocess/output/pose.json --output result.blend --jobs 2
+
+With more than one job every clip is retargeted by its own background blender process,
+which writes the actions of the clip into a .blend library. The actions are then merged
+into the NLA of the model in the order of the given clips, continuing the translation of
+the previous clip like a single process would.
+"""
+import bpy
+import os
+import sys
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blender import pose_application as app
+
+
+def parse_args(argv: list) -> argparse.Namespace:
+    # Blender passes everything after "--" to the script
+    argv = argv[argv.index("--") + 1:] if "--" in argv else []
+
+    parser = argparse.ArgumentParser(prog="blender --background --python pose_cli.py --",
+                                     description="Apply preprocessed pose-estimations onto a model")
+    parser.add_argument("--clips", nargs="+", required=True, help="Preprocessed jsons, one per clip")
+    parser.add_argument("--model", default=app.MODEL_NAME, help="The name of the model inside of blender")
+    parser.add_argument("--distance-factor", type=float, default=app.DISTANCE_FACTOR)
+    parser.add_argument("--avg-over-n-frames", type=int, default=app.AVG_OVER_N_FRAMES)
+    parser.add_argument("--frames-between", type=int, nargs="*", default=app.FRAMES_BETWEEN)
+    parser.add_argument("--holistic-subsets", nargs="*", default=[], choices=list(app.HOLISTIC_CONNECTIONS),
+                        help="Landmark subsets of the holistic preprocessing driving the model as well")
+    parser.add_argument("--bake", action="store_true", help="Bake the constraints into pose-bone rotations")
+    parser.add_argument("--remove-landmarks", action="store_true", help="Remove the landmarks and constraints after baking")
+    parser.add_argument("--output", help="Save the resulting .blend file here")
+    parser.add_argument("--actions-out", help="Write the resulting actions into this .blend library")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of parallel blender processes, one per clip")
+    return parser.parse_args(argv)
+
+
+def write_actions(path: str, model) -> None:
+    actions = set(strip.action for strips in model.clips.values() for strip in strips)
+    bpy.data.libraries.write(path, actions, fake_user=True)
+
+
+def run_worker(args: argparse.Namespace, clip: str, actions_out: str) -> None:
+    command = [
+        bpy.app.binary_path, bpy.data.filepath, "--background", "--python", os.path.abspath(__file__), "--",
+        "--clips", clip, "--model", args.model, "--distance-factor", str(args.distance_factor),
+        "--avg-over-n-frames", str(args.avg_over_n_frames), "--actions-out", actions_out,
+    ] + (["--bake"] if args.bake else []) + (["--holistic-subsets"] + args.holistic_subsets if args.holistic_subsets else [])
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+
+
+def offset_location(action, offset) -> None:
+    """
+    Offset the location keyframes (including their handles) of an action
+    """
+    for index in range(3):
+        fcurve = action.fcurves.find("location", index=index)
+        if fcurve is None:
+            continue
+        points = fcurve.keyframe_points
+        for attribute in ("co", "handle_left", "handle_right"):
+            values = np.empty(2 * len(points), dtype=np.float32)
+            points.foreach_get(attribute, values)
+            values[1::2] += offset[index]
+            points.foreach_set(attribute, values)
+        fcurve.update()
+
+
+def merge(args: argparse.Namespace, libraries: list):
+    """
+    Place the actions written by the worker processes as NLA-strips, in the order of the clips
+    """
+    model = app.m.Model(app.CONNECTIONS, bpy.data.objects[args.model], bpy.data.armatures[args.model], args.distance_factor,
+                        joint_limits=app.constraints.JOINT_LIMITS if app.USE_JOINT_LIMITS else None, bake=args.bake)
+    model.reset()
+
+    blend_in = 0
+    for i, (clip, library) in enumerate(zip(args.clips, libraries)):
+        with bpy.data.libraries.load(library) as (data_from, data_to):
+            names = list(data_from.actions)
+            data_to.actions = names
+
+        # The loaded actions might have been renamed on collisions, thus use the names inside of the library
+        name = app.clip_name(clip)
+        actions = {action_name.split("|", 1)[1]: action for action_name, action in zip(names, data_to.actions)}
+
+        # Every worker started from the model's origin, the clip continues from the end of the previous one.
+        # The landmarks are placed in world space, below the scaled landmark parent
+        translation = model.previous_model_matrix.translation
+        for owner_name, action in actions.items():
+            scale = 1 if owner_name == model.model.name else model.landmark_parent.scale[0]
+            offset_location(action, translation / scale)
+        model.place_clip(name, actions, blend_in)
+
+        blend_in = 0
+        if not len(args.frames_between) - 1 < i:
+            model.current_frame += args.frames_between[i]
+            blend_in = max(0, -args.frames_between[i])
+
+    if args.bake and args.remove_landmarks:
+        model.remove_landmarks()
+
+    return model
+
+
+def main() -> None:
+    args = parse_args(sys.argv)
+    app.use_holistic_subsets(args.holistic_subsets)
+
+    if args.jobs > 1 and len(args.clips) > 1:
+        # The workers open the same .blend file to find the model
+        if not bpy.data.filepath:
+            raise RuntimeError("--jobs requires a saved .blend file, pass it to blender before --background")
+        with tempfile.TemporaryDirectory() as directory:
+            libraries = [os.path.join(directory, "{}_{}.blend".format(i, app.clip_name(clip))) for i, clip in enumerate(args.clips)]
+            with ThreadPoolExecutor(args.jobs) as pool:
+                list(pool.map(lambda clip_library: run_worker(args, *clip_library), zip(args.clips, libraries)))
+            model = merge(args, libraries)
+            if args.actions_out:
+                write_actions(args.actions_out, model)
+    else:
+        model = app.apply_clips(args.clips, args.model, args.distance_factor, args.avg_over_n_frames, args.frames_between,
+                                bake=args.bake, remove_landmarks=args.remove_landmarks)
+        if args.actions_out:
+            write_actions(args.actions_out, model)
+
+    if args.output:
+        bpy.ops.wm.save_as_mainfile(filepath=os.path.abspath(args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+"""
+Preprocessing of videos into landmarks, run the modules with ``python -m preprocess.<module>``
+"""
@@ -0,0 +1,91 @@
+import time
+
+import numpy as np
+
+
+class cameraMotionEstimator():
+    """
+    Estimates the global camera motion frame by frame with sparse optical flow on background
+    features (outside of the persons) of a downscaled grayscale image. The accumulated motion
+    maps every frame back onto the first one, such that it can be subtracted from the landmarks
+    """
+
+    def __init__(self, scale=0.25, max_corners=200, roi_padding=0.1, min_features=8):
+        self.scale = scale
+        self.max_corners = max_corners
+        self.roi_padding = roi_padding
+        self.min_features = min_features
+
+        self.prev_gray = None
+        self.prev_mask = None
+        # Affine transformation (2x3) from the current frame onto the first one, in normalized coordinates
+        self.transform = [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]]
+        self.frames = 0
+        self.seconds = 0.0
+
+    def createMask(self, shape, rois):
+        h, w = shape
+        mask = np.full(shape, 255, dtype=np.uint8)
+        for x0, y0, x1, y1 in rois:
+            pad_x, pad_y = (x1 - x0) * self.roi_padding, (y1 - y0) * self.roi_padding
+            x0, x1 = int(max((x0 - pad_x) * w, 0)), int(min((x1 + pad_x) * w, w))
+            y0, y1 = int(max((y0 - pad_y) * h, 0)), int(min((y1 + pad_y) * h, h))
+            mask[y0:y1, x0:x1] = 0
+        return mask
+
+    def update(self, img, rois=()):
+        """
+        Estimate the motion of the camera between the previous and this frame, rois are the
+        normalized (x0, y0, x1, y1) boxes of the persons which are excluded from the features
+        """
+        import cv2
+        start = time.perf_counter()
+
+        gray = cv2.cvtColor(cv2.resize(img, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA),
+                            cv2.COLOR_BGR2GRAY)
+        h, w = gray.shape
+
+        if self.prev_gray is not None:
+            prev_pts = cv2.goodFeaturesToTrack(self.prev_gray, self.max_corners, 0.01, 8, mask=self.prev_mask)
+            if prev_pts is not None and len(prev_pts) >= self.min_features:
+                pts, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, prev_pts, None)
+                found = status.ravel() == 1
+                if np.count_nonzero(found) >= self.min_features:
+                    # Maps the points of this frame onto the previous one
+                    affine, _ = cv2.estimateAffinePartial2D(pts[found], prev_pts[found], method=cv2.RANSAC)
+                    if affine is not None:
+                        # Into normalized coordinates
+                        affine[0, 2] /= w
+                        affine[1, 2] /= h
+                        affine[0, 1] *= h / w
+                        affine[1, 0] *= w / h
+                        transform = np.vstack([self.transform, [0, 0, 1]]) @ np.vstack([affine, [0, 0, 1]])
+                        self.transform = transform[:2].tolist()
+
+        self.prev_gray = gray
+        self.prev_mask = self.createMask(gray.shape, rois)
+
+        self.frames += 1
+        self.seconds += time.perf_counter() - start
+        return self.transform
+
+    def compensate(self, landmarks):
+        """
+        Map the (normalized) landmarks of the current frame, an array with the shape (..., 3),
+        in place onto the first frame
+        """
+        (a, b, c), (d, e, f) = self.transform
+        x = landmarks[..., 0].copy()
+        landmarks[..., 0] = a * x + b * landmarks[..., 1] + c
+        landmarks[..., 1] = d * x + e * landmarks[..., 1] + f
+        return landmarks
+
+    @staticmethod
+    def landmarkRoi(landmarks):
+        x0, y0 = np.nanmin(landmarks[..., :2].reshape(-1, 2), axis=0)
+        x1, y1 = np.nanmax(landmarks[..., :2].reshape(-1, 2), axis=0)
+        return (x0, y0, x1, y1)
+
+    def report(self):
+        if self.frames:
+            print("Camera motion estimation: {:.2f} ms per frame".format(self.seconds / self.frames * 1000))
@@ -0,0 +1,151 @@
+import numpy as np
+
+
+# The whole face mesh of a frame is stored as one array under this name inside of the jsons
+MESH = "FaceMesh"
+
+
+def found(landmarks):
+    """
+    Whether any landmark of a frame (an array with the shape (joints, 3)) was found
+    """
+    return not np.isnan(landmarks[:, 0]).all()
+
+
+class landmarkSequence():
+    """
+    The landmarks of a sequence of frames inside of one preallocated, contiguous float32 buffer
+    with the shape (frames, joints, 3) and a fixed slot per joint, landmarks which were not found
+    are NaN. Frames (sequence[i]), joints (joint(name)) and the whole sequence (data) are views
+    into the buffer, nothing is copied. Growing the buffer (append) invalidates earlier views
+    """
+
+    def __init__(self, joints, capacity=256):
+        self.joints = list(joints)
+        # The slot of every joint
+        self.index = {name: i for i, name in enumerate(self.joints)}
+        self.buffer = np.full((capacity, len(self.joints), 3), np.nan, dtype=np.float32)
+        # The video-frame of every entry
+        self._frames = np.zeros(capacity, dtype=np.int64)
+        # The face mesh is only allocated once it is needed
+        self._mesh = None
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        return self.data[i]
+
+    @property
+    def data(self):
+        return self.buffer[:self.length]
+
+    @property
+    def frames(self):
+        return self._frames[:self.length]
+
+    @property
+    def mesh(self):
+        return None if self._mesh is None else self._mesh[:self.length]
+
+    def joint(self, name):
+        """
+        The positions of a joint in all frames as view with the shape (frames, 3)
+        """
+        return self.buffer[:self.length, self.index[name]]
+
+    def reserve(self, capacity):
+        if capacity <= len(self.buffer):
+            return
+        buffer = np.full((capacity,) + self.buffer.shape[1:], np.nan, dtype=np.float32)
+        buffer[:self.length] = self.data
+        self.buffer = buffer
+        self._frames = np.concatenate([self._frames, np.zeros(capacity - len(self._frames), dtype=np.int64)])
+        if self._mesh is not None:
+            mesh = np.full((capacity,) + self._mesh.shape[1:], np.nan, dtype=np.float32)
+            mesh[:self.length] = self.mesh
+            self._mesh = mesh
+
+    def append(self, frame=None):
+        """
+        Append a frame (all landmarks NaN) and return it as view with the shape (joints, 3),
+        to be filled in place. The video-frame defaults to the one after the previous entry
+        """
+        if self.length == len(self.buffer):
+            self.reserve(2 * len(self.buffer))
+
+        self.buffer[self.length] = np.nan
+        if self._mesh is not None:
+            self._mesh[self.length] = np.nan
+        self._frames[self.length] = frame if frame is not None else (self._frames[self.length - 1] + 1 if self.length else 0)
+        self.length += 1
+        return self.buffer[self.length - 1]
+
+    def drop(self):
+        """
+        Drop the last frame, e.g. if nothing was found in it
+        """
+        self.length -= 1
+
+    def meshFrame(self, i, points):
+        """
+        The face mesh of a frame as view with the shape (points, 3), to be filled in place
+        """
+        if self._mesh is None:
+            self._mesh = np.full((len(self.buffer), points, 3), np.nan, dtype=np.float32)
+        return self._mesh[i]
+
+    def toPoses(self, bones=None):
+        """
+        The frames as list of dicts (bone->[x, y, z]) like they are stored inside of the jsons,
+        landmarks which were not found are omitted
+
+        Parameters
+        ----------
+        bones: list = None
+            The names of the landmarks to store, all joints (and the face mesh) by default
+        """
+        bones = self.joints + [MESH] if bones is None else bones
+        slots = [(name, self.index[name]) for name in bones if name in self.index]
+        data = self.data.tolist()
+        found = ~np.isnan(self.data[:, :, 0])
+
+        mesh = self.mesh if MESH in bones else None
+        mesh_found = None if mesh is None else ~np.isnan(mesh[:, :, 0]).all(axis=1)
+
+        poses = []
+        for i in range(self.length):
+            pose = {name: data[i][slot] for name, slot in slots if found[i, slot]}
+            if mesh is not None and mesh_found[i]:
+                pose[MESH] = mesh[i].tolist()
+            poses.append(pose)
+        return poses
+
+    @classmethod
+    def fromPoses(cls, poses, joints=None, frames=None):
+        """
+        Fill a sequence from a list of dicts (bone->[x, y, z]) like they are stored inside of the jsons
+
+        Parameters
+        ----------
+        poses: list
+            The landmarks of every frame
+        joints: list = None
+            The slots of the sequence (e.g. the "bones" of the json), the landmarks of the first
+            frame by default, landmarks without a slot are ignored
+        frames: list = None
+            The video-frame of every entry
+        """
+        if joints is None:
+            joints = poses[0].keys() if poses else []
+        sequence = cls([name for name in joints if name != MESH], max(len(poses), 1))
+
+        for i, pose in enumerate(poses):
+            landmarks = sequence.append(None if frames is None else frames[i])
+            for name, pos in pose.items():
+                if name in sequence.index:
+                    landmarks[sequence.index[name]] = pos
+                elif name == MESH:
+                    sequence.meshFrame(i, len(pos))[:] = pos
+        return sequence
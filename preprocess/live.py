@@ -0,0 +1,106 @@
+"""
+Live mode: estimate the pose of a camera, stream or video file frame by frame and publish the
+landmarks of every frame over a local UDP socket, consumed e.g. by blender/libs/live.py
+
+    python -m preprocess.live 0                    # webcam
+    python -m preprocess.live rtsp://host/stream   # stream url
+    python -m preprocess.live walking.mp4          # replayed at its real frame rate
+"""
+import os
+import time
+import socket
+import struct
+import argparse
+
+import numpy as np
+
+from .landmarks import found
+from .mp_pose_preprocess import poseDetector
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 9999
+
+# Sequence number and capture time (time.time()) of the frame, followed by the landmarks
+HEADER = struct.Struct("<Id")
+# The fixed order of the landmarks inside of a packet (the slots of the detector), landmarks
+# which were not found are NaN
+BONES = poseDetector.JOINTS
+
+
+def packFrame(sequence, timestamp, landmarks):
+    """
+    Landmarks is a frame filled by poseDetector.findPose, an array with the shape (len(BONES), 3)
+    """
+    return HEADER.pack(sequence, timestamp) + landmarks.tobytes()
+
+
+def unpackFrame(packet):
+    """
+    Returns the sequence number, the capture time and the landmarks (in the order of BONES)
+    as array with the shape (len(BONES), 3)
+    """
+    sequence, timestamp = HEADER.unpack_from(packet)
+    return sequence, timestamp, np.frombuffer(packet, dtype=np.float32, offset=HEADER.size).reshape(-1, 3)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estimate the pose live and publish the landmarks of every frame over UDP")
+    parser.add_argument("source", help="A camera index, stream url or the path to a video")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--subsets", nargs="+", choices=poseDetector.SUBSETS, default=["pose"],
+                        help="The landmarks to compute, hands and face only cost inference time if selected")
+    parser.add_argument("--as-fast-as-possible", action="store_true",
+                        help="Do not replay video files at their real frame rate")
+    parser.add_argument("--show", action="store_true", help="Show the estimated pose")
+    args = parser.parse_args(argv)
+
+    import cv2
+    # A camera index, otherwise a stream url or video file
+    is_file = os.path.isfile(args.source)
+    cap = cv2.VideoCapture(int(args.source) if args.source.isdigit() else args.source)
+    # Files are replayed at their real frame rate, cameras and streams deliver frames in real time
+    frame_time = 1 / (cap.get(cv2.CAP_PROP_FPS) or 30) if is_file and not args.as_fast_as_possible else 0
+    detector = poseDetector(subsets=args.subsets)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    sequence = 0
+    start = time.perf_counter()
+    seconds = 0.0
+
+    while True:
+        if frame_time:
+            delay = start + sequence * frame_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        success, img = cap.read()
+        if not success:
+            cap.release()
+            break
+        timestamp = time.time()
+
+        img = detector.process(img)
+        landmarks = detector.findPose(img)
+        # Only frames with the body are of use, hands or face alone can not pose the model
+        if found(landmarks[:len(poseDetector.BODY_JOINTS)]):
+            sock.sendto(packFrame(sequence, timestamp, landmarks), (args.host, args.port))
+        seconds += time.time() - timestamp
+        sequence += 1
+
+        if args.show:
+            img = detector.draw(img)
+            cv2.namedWindow('Image', cv2.WINDOW_NORMAL)
+            cv2.resizeWindow('Image', 800, 600)
+            cv2.imshow("Image", img)
+            if cv2.waitKey(1) & 0xFF == 27:
+                break
+
+    sock.close()
+    if sequence:
+        print("Pose estimation: {:.2f} ms per frame".format(seconds / sequence * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import time
+import json
+import argparse
+from multiprocessing import Pool
+
+import numpy as np
+
+from .camera_motion import cameraMotionEstimator
+from .landmarks import landmarkSequence
+from .mp_pose_preprocess import poseDetector
+
+
+# Every worker of the pool holds its own pose graph
+worker_pose = None
+
+
+def init_worker(complexity, detection_conf):
+    global worker_pose
+    import mediapipe as mp
+    # Crops of different frames can be processed by different workers, thus no tracking inside of mediapipe
+    worker_pose = mp.solutions.pose.Pose(static_image_mode=True, model_complexity=complexity,
+                                         min_detection_confidence=detection_conf)
+
+
+def estimate_crop(crop):
+    import cv2
+    results = worker_pose.process(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB))
+    if not results.pose_landmarks:
+        return None
+    # A compact array is cheaper to send back from the worker than nested lists
+    landmarks = np.empty((len(poseDetector.BODY_JOINTS), 3), dtype=np.float32)
+    for id, lm in enumerate(results.pose_landmarks.landmark):
+        landmarks[id] = lm.x, lm.y, lm.z
+    return landmarks
+
+
+def iou(boxes_a, boxes_b):
+    """
+    Pairwise intersection over union of two arrays of (x, y, w, h) boxes
+    """
+    a = np.asarray(boxes_a, dtype=float)[:, None]
+    b = np.asarray(boxes_b, dtype=float)[None, :]
+    w = np.clip(np.minimum(a[..., 0] + a[..., 2], b[..., 0] + b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    h = np.clip(np.minimum(a[..., 1] + a[..., 3], b[..., 1] + b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    intersection = w * h
+    return intersection / (a[..., 2] * a[..., 3] + b[..., 2] * b[..., 3] - intersection)
+
+
+class personTracker():
+    """
+    Links the detections of successive frames to stable track-ids by a hungarian
+    assignment on the bounding-box IoU
+    """
+
+    def __init__(self, min_iou=0.3, max_missed=10):
+        self.min_iou = min_iou
+        self.max_missed = max_missed
+        self.next_id = 0
+        # track-id -> [box, missed frames]
+        self.tracks = dict()
+
+    def update(self, boxes):
+        from scipy.optimize import linear_sum_assignment
+        ids = list(self.tracks.keys())
+        assigned = [None] * len(boxes)
+
+        if len(ids) and len(boxes):
+            overlap = iou([self.tracks[id][0] for id in ids], boxes)
+            rows, cols = linear_sum_assignment(-overlap)
+            for row, col in zip(rows, cols):
+                if overlap[row, col] >= self.min_iou:
+                    assigned[col] = ids[row]
+
+        for id in ids:
+            self.tracks[id][1] += 1
+        for i, box in enumerate(boxes):
+            if assigned[i] is None:
+                assigned[i] = self.next_id
+                self.next_id += 1
+            self.tracks[assigned[i]] = [box, 0]
+
+        # Tracks which have not been seen for a while are dropped
+        self.tracks = {id: track for id, track in self.tracks.items() if track[1] <= self.max_missed}
+        return assigned
+
+
+class multiPoseDetector():
+    """
+    Detects people, crops each of them and estimates the pose per crop inside a pool of workers
+    """
+
+    def __init__(self, workers=4, complexity=1, detection_conf=0.8, padding=0.15, detection_scale=0.5):
+        self.padding = padding
+        self.detection_scale = detection_scale
+
+        import cv2
+        self.hog = cv2.HOGDescriptor()
+        self.hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+        self.tracker = personTracker()
+        self.pool = Pool(workers, init_worker, (complexity, detection_conf))
+
+    def detect(self, img):
+        import cv2
+        small = cv2.resize(img, None, fx=self.detection_scale, fy=self.detection_scale)
+        rects, weights = self.hog.detectMultiScale(small, winStride=(8, 8), padding=(8, 8), scale=1.05)
+        if len(rects) == 0:
+            return []
+
+        keep = cv2.dnn.NMSBoxes([list(map(int, r)) for r in rects], [float(w) for w in np.ravel(weights)], 0.3, 0.4)
+        h, w = img.shape[:2]
+        boxes = []
+        for i in np.ravel(keep):
+            x, y, bw, bh = rects[i] / self.detection_scale
+            x, y = x - bw * self.padding, y - bh * self.padding
+            bw, bh = bw * (1 + 2 * self.padding), bh * (1 + 2 * self.padding)
+            x0, y0 = int(max(x, 0)), int(max(y, 0))
+            x1, y1 = int(min(x + bw, w)), int(min(y + bh, h))
+            if x1 > x0 and y1 > y0:
+                boxes.append((x0, y0, x1 - x0, y1 - y0))
+        return boxes
+
+    def findPoses(self, img):
+        """
+        Returns a dict track-id -> landmarks (an array with the shape (len(BODY_JOINTS), 3)),
+        the landmarks are normalized to the whole image
+        """
+        boxes = self.detect(img)
+        ids = self.tracker.update(boxes)
+        crops = [img[y:y + bh, x:x + bw] for (x, y, bw, bh) in boxes]
+
+        h, w = img.shape[:2]
+        poses = dict()
+        for id, (x, y, bw, bh), landmarks in zip(ids, boxes, self.pool.map(estimate_crop, crops)):
+            if landmarks is None:
+                continue
+            # From the crop onto the whole image, in place
+            landmarks *= (bw / w, bh / h, bw / w)
+            landmarks[:, :2] += (x / w, y / h)
+            poses[id] = landmarks
+
+        self.boxes = dict(zip(ids, boxes))
+        return poses
+
+    def draw(self, img):
+        import cv2
+        for id, (x, y, bw, bh) in self.boxes.items():
+            cv2.rectangle(img, (x, y), (x + bw, y + bh), (0, 255, 255), 4)
+            cv2.putText(img, str(id), (x, y + 40), cv2.FONT_HERSHEY_PLAIN, 3, (0, 255, 255), 3)
+        return img
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Track multiple persons and estimate their poses frame by frame")
+    parser.add_argument("video", help="The path to the video")
+    parser.add_argument("destination", help="The json file the landmarks per track are written to")
+    parser.add_argument("workers", nargs="?", type=int, default=4, help="Number of pose-estimation workers")
+    parser.add_argument("--stabilize", action="store_true",
+                        help="Estimate the camera motion and subtract it from the landmarks")
+    args = parser.parse_args(argv)
+
+    import cv2
+    cap = cv2.VideoCapture(args.video)
+    pTime = 0
+    detector = multiPoseDetector(args.workers)
+    camera = cameraMotionEstimator() if args.stabilize else None
+
+    tracks = dict()
+    frame = 0
+
+    while True:
+        success, img = cap.read()
+        if not success:
+            cap.release()
+            break
+
+        poses = detector.findPoses(img)
+        if camera:
+            h, w = img.shape[:2]
+            camera.update(img, [(x / w, y / h, (x + bw) / w, (y + bh) / h) for (x, y, bw, bh) in detector.boxes.values()])
+            for landmarks in poses.values():
+                camera.compensate(landmarks)
+
+        for id, landmarks in poses.items():
+            if id not in tracks:
+                tracks[id] = landmarkSequence(poseDetector.BODY_JOINTS)
+            tracks[id].append(frame)[:] = landmarks
+        img = detector.draw(img)
+        frame += 1
+
+        cTime = time.time()
+        fps = 1 / (cTime - pTime)
+        pTime = cTime
+
+        cv2.putText(img, str(int(fps)), (70, 50), cv2.FONT_HERSHEY_PLAIN, 3,
+                    (255, 0, 0), 3)
+        cv2.namedWindow('Image', cv2.WINDOW_NORMAL)
+        cv2.resizeWindow('Image', 800, 600)
+
+        cv2.imshow("Image", img)
+        cv2.waitKey(1)
+
+    detector.close()
+    if camera:
+        camera.report()
+
+    _dict = {
+        "bones": poseDetector.BODY_JOINTS,
+        "tracks": {str(id): {"frames": track.frames.tolist(), "poses": track.toPoses()} for id, track in tracks.items()}
+    }
+    with open(args.destination, "w+") as f:
+        json.dump(_dict, f)
+
+
+if __name__ == "__main__":
+    main()
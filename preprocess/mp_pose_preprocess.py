@@ -1,10 +1,14 @@
-import cv2
-import mediapipe as mp
 import time
 import json
-import sys
+import argparse
 from operator import xor
 
+import numpy as np
+
+from .camera_motion import cameraMotionEstimator
+from .landmarks import MESH, found, landmarkSequence
+
+
 class poseDetector():
     # Under: https://google.github.io/mediapipe/images/mobile/pose_tracking_full_body_landmarks.png
     BODY_PARTS = {
@@ -27,20 +31,116 @@ class poseDetector():
         24: "upperleg01.R", 26: "lowerleg01.R", 28: "foot.R", 30: "RightHeel", 32: "RightFootIndex" 
     }
 
+    # Under: https://google.github.io/mediapipe/images/mobile/hand_landmarks.png
+    # Named after the finger bones of the model, suffixed with ".L"/".R", the tips are no bones
+    HAND_PARTS = {
+        0: "HandWrist",
+        1: "finger1-1", 2: "finger1-2", 3: "finger1-3", 4: "finger1-tip",
+        5: "finger2-1", 6: "finger2-2", 7: "finger2-3", 8: "finger2-tip",
+        9: "finger3-1", 10: "finger3-2", 11: "finger3-3", 12: "finger3-tip",
+        13: "finger4-1", 14: "finger4-2", 15: "finger4-3", 16: "finger4-tip",
+        17: "finger5-1", 18: "finger5-2", 19: "finger5-3", 20: "finger5-tip"
+    }
+
+    # Points of the face mesh driving the head, the chin is named after the "head" bone
+    # such that the head points from the chin to the top of the forehead
+    FACE_PARTS = {
+        152: "head", 10: "HeadTop"
+    }
+    # The whole face mesh is stored as one array under this name
+    FACE_MESH = MESH
+    FACE_MESH_POINTS = 468
+
+    # The fixed slot of every landmark inside of a frame (see landmarks.landmarkSequence), body first
+    # such that the slot of a body part is its id
+    BODY_JOINTS = list(map(BODY_PARTS.get, sorted(BODY_PARTS)))
+    JOINTS = BODY_JOINTS + [name + ".L" for name in HAND_PARTS.values()] \
+        + [name + ".R" for name in HAND_PARTS.values()] + list(FACE_PARTS.values())
+    # Face mesh id -> slot
+    FACE_SLOTS = dict(zip(FACE_PARTS, range(len(JOINTS) - len(FACE_PARTS), len(JOINTS))))
+
+    SUBSETS = ("pose", "hands", "face")
+
 
     def __init__(self, static_image=False, complexity=1, smooth=True,
-                 detection_conf=0.8, track_conf=0.2):
+                 detection_conf=0.8, track_conf=0.2, subsets=("pose",)):
         self.static_image = static_image
         self.complexity = complexity
         self.smooth = smooth
         self.detection_conf = detection_conf
         self.track_conf = track_conf
+        # The body is always needed, hands and face only cost inference time if selected
+        self.subsets = set(subsets) | {"pose"}
+
+        # The mediapipe graphs are only created once they are needed
+        self._pose = None
+        self._hands = None
+        self._faceMesh = None
+        self._holistic = None
+        self.mpDraw = None
+
+        # Filled in place by findPose if no frame of a sequence is given
+        self.landmarks = landmarkSequence(self.JOINTS, 1).append()
+
+
+    @property
+    def pose(self):
+        if self._pose is None:
+            import mediapipe as mp
+            self.mpPose = mp.solutions.pose
+            self._pose = self.mpPose.Pose(static_image_mode=self.static_image, model_complexity=self.complexity,
+                                          smooth_landmarks=self.smooth, min_detection_confidence=self.detection_conf,
+                                          min_tracking_confidence=self.track_conf)
+        return self._pose
+
+
+    @property
+    def hands(self):
+        if self._hands is None:
+            import mediapipe as mp
+            self._hands = mp.solutions.hands.Hands(static_image_mode=self.static_image, max_num_hands=2,
+                                                   min_detection_confidence=self.detection_conf,
+                                                   min_tracking_confidence=self.track_conf)
+        return self._hands
+
+
+    @property
+    def faceMesh(self):
+        if self._faceMesh is None:
+            import mediapipe as mp
+            self._faceMesh = mp.solutions.face_mesh.FaceMesh(static_image_mode=self.static_image, max_num_faces=1,
+                                                             min_detection_confidence=self.detection_conf,
+                                                             min_tracking_confidence=self.track_conf)
+        return self._faceMesh
+
+
+    @property
+    def holistic(self):
+        # If hands and face are both needed a single holistic graph is cheaper than three graphs
+        if self._holistic is None:
+            import mediapipe as mp
+            self._holistic = mp.solutions.holistic.Holistic(static_image_mode=self.static_image,
+                                                            model_complexity=self.complexity,
+                                                            smooth_landmarks=self.smooth,
+                                                            min_detection_confidence=self.detection_conf,
+                                                            min_tracking_confidence=self.track_conf)
+        return self._holistic
+
+
+    @property
+    def bones(self):
+        bones = list(self.BODY_PARTS.values())
+        if "hands" in self.subsets:
+            bones += [name + side for side in (".L", ".R") for name in self.HAND_PARTS.values()]
+        if "face" in self.subsets:
+            bones += list(self.FACE_PARTS.values()) + [self.FACE_MESH]
+        return bones
 
+
+    def setupDrawing(self):
+        import mediapipe as mp
         self.mpDraw = mp.solutions.drawing_utils
         self.mpPose = mp.solutions.pose
-        self.pose = self.mpPose.Pose(self.static_image, self.complexity, self.smooth,
-                                     self.detection_conf, self.track_conf)
-        
 
         # White
         self.style_neutral = self.mpDraw.DrawingSpec()
@@ -64,12 +164,53 @@ class poseDetector():
         self.connections_left = set(filter(lambda x: x[0] % 2 == 1 and x[1] % 2 == 1, self.mpPose.POSE_CONNECTIONS))
 
     def process(self, img):
+        import cv2
         imgRGB = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        self.results = self.pose.process(imgRGB)
+
+        self.leftHand, self.rightHand, self.face = None, None, None
+        if {"hands", "face"} <= self.subsets:
+            self.results = self.holistic.process(imgRGB)
+            # The holistic hands are found by means of the pose, thus left/right are the ones of the person
+            self.leftHand, self.rightHand = self.results.left_hand_landmarks, self.results.right_hand_landmarks
+            self.face = self.results.face_landmarks
+        else:
+            self.results = self.pose.process(imgRGB)
+            if "hands" in self.subsets:
+                self.assignHands(self.hands.process(imgRGB).multi_hand_landmarks)
+            if "face" in self.subsets:
+                faces = self.faceMesh.process(imgRGB).multi_face_landmarks
+                self.face = faces[0] if faces else None
         return img
 
 
+    def assignHands(self, hands):
+        """
+        Assign the detected hands to the closest wrists of the pose, the handedness of mediapipe's
+        hand solution assumes mirrored images and is thus not reliable
+        """
+        if not hands or not self.results.pose_landmarks:
+            return
+
+        wrists = self.results.pose_landmarks.landmark[15], self.results.pose_landmarks.landmark[16]
+        def distance(hand, wrist):
+            return (hand.landmark[0].x - wrist.x) ** 2 + (hand.landmark[0].y - wrist.y) ** 2
+
+        if len(hands) == 1:
+            if distance(hands[0], wrists[0]) <= distance(hands[0], wrists[1]):
+                self.leftHand = hands[0]
+            else:
+                self.rightHand = hands[0]
+        else:
+            straight = distance(hands[0], wrists[0]) + distance(hands[1], wrists[1])
+            crossed = distance(hands[0], wrists[1]) + distance(hands[1], wrists[0])
+            self.leftHand, self.rightHand = (hands[0], hands[1]) if straight <= crossed else (hands[1], hands[0])
+
+
     def draw(self, img):
+        import cv2
+        if self.mpDraw is None:
+            self.setupDrawing()
+
         if self.results.pose_landmarks:
             self.mpDraw.draw_landmarks(img, self.results.pose_landmarks,
                                         self.connections_right, self.style_right, self.style_right)
@@ -78,64 +219,113 @@ class poseDetector():
             self.mpDraw.draw_landmarks(img, self.results.pose_landmarks,
                                         self.connections_neutral, self.style_neutral, self.style_neutral)
             
-            for landmark in self.screenSpaceLmList: 
-                cv2.circle(img, (landmark[0], landmark[1]), 5, (255, 0, 0), cv2.FILLED)
+        h, w, c = img.shape
+        for x, y in self.landmarks[~np.isnan(self.landmarks[:, 0]), :2]:
+            cv2.circle(img, (int(x * w), int(y * h)), 5, (255, 0, 0), cv2.FILLED)
         return img
 
 
-    def findPose(self, img):
-        self.lmDict = dict()
-        self.screenSpaceLmList = list()
+    def findPose(self, img, landmarks=None, mesh=None):
+        """
+        Fill the landmarks found by process into a frame (an array with the shape (len(JOINTS), 3),
+        e.g. the next frame of a landmarkSequence) in place, landmarks which were not found are NaN
+
+        Parameters
+        ----------
+        img: np.ndarray
+            The processed image
+        landmarks: np.ndarray = None
+            The frame to fill, a frame of the detector by default
+        mesh: np.ndarray = None
+            An array with the shape (FACE_MESH_POINTS, 3) the face mesh is filled into, if the face is selected
+        """
+        if landmarks is None:
+            landmarks = self.landmarks
+        landmarks[:] = float("nan")
+        self.landmarks = landmarks
+
+        # The slot of a body part is its id
         if self.results.pose_landmarks:
             for id, lm in enumerate(self.results.pose_landmarks.landmark):
-                h, w, c = img.shape
-                cx, cy = int(lm.x * w), int(lm.y * h)
-                self.screenSpaceLmList.append((cx, cy))
-                self.lmDict[self.BODY_PARTS[id]] = [lm.x, lm.y, lm.z]
+                landmarks[id] = lm.x, lm.y, lm.z
 
-        return self.lmDict
+        # Hands and face are only filled if they were found
+        for offset, hand in ((len(self.BODY_JOINTS), self.leftHand),
+                             (len(self.BODY_JOINTS) + len(self.HAND_PARTS), self.rightHand)):
+            if hand:
+                for id, lm in enumerate(hand.landmark):
+                    landmarks[offset + id] = lm.x, lm.y, lm.z
+        if self.face:
+            for id, slot in self.FACE_SLOTS.items():
+                lm = self.face.landmark[id]
+                landmarks[slot] = lm.x, lm.y, lm.z
+            if mesh is not None:
+                for id, lm in enumerate(self.face.landmark[:len(mesh)]):
+                    mesh[id] = lm.x, lm.y, lm.z
+
+        return landmarks
         
 
-name = sys.argv[1]
-source = sys.argv[2]
-cap = cv2.VideoCapture(name)
-pTime = 0
-detector = poseDetector()
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estimate the pose of a person frame by frame and store the landmarks as json")
+    parser.add_argument("video", help="The path to the video")
+    parser.add_argument("destination", help="The json file the landmarks are written to")
+    parser.add_argument("--stabilize", action="store_true",
+                        help="Estimate the camera motion and subtract it from the landmarks")
+    parser.add_argument("--subsets", nargs="+", choices=poseDetector.SUBSETS, default=["pose"],
+                        help="The landmarks to compute, hands and face only cost inference time if selected")
+    args = parser.parse_args(argv)
+
+    import cv2
+    cap = cv2.VideoCapture(args.video)
+    pTime = 0
+    detector = poseDetector(subsets=args.subsets)
+    camera = cameraMotionEstimator() if args.stabilize else None
 
-poses = []
+    sequence = landmarkSequence(poseDetector.JOINTS)
 
-while True:
-    success, img = cap.read()
-    if not success:
-        cap.release()
-        break
+    while True:
+        success, img = cap.read()
+        if not success:
+            cap.release()
+            break
     
-    img = detector.process(img)
-    lmDict = detector.findPose(img)
-    img = detector.draw(img)
-    if len(lmDict) !=0:
-        poses.append(lmDict)
-
-    cTime = time.time()
-    fps = 1 / (cTime - pTime)
-    pTime = cTime
-
-    cv2.putText(img, str(int(fps)), (70, 50), cv2.FONT_HERSHEY_PLAIN, 3,
-                (255, 0, 0), 3)
-    cv2.namedWindow('Image', cv2.WINDOW_NORMAL)
-    cv2.resizeWindow('Image', 800, 600)
-
-    cv2.imshow("Image", img)
-    cv2.waitKey(1)
-
-bones = []
-for key, value in poseDetector.BODY_PARTS.items():
-    bones.append(value)
-
-
-_dict = {
-    "bones": bones,
-    "poses": poses
-}
-with open(source, "w+") as f:
-    json.dump(_dict, f)
\ No newline at end of file
+        img = detector.process(img)
+        landmarks = sequence.append()
+        mesh = sequence.meshFrame(len(sequence) - 1, poseDetector.FACE_MESH_POINTS) if "face" in detector.subsets else None
+        detector.findPose(img, landmarks, mesh)
+        if camera:
+            camera.update(img, [camera.landmarkRoi(landmarks)] if found(landmarks) else [])
+        img = detector.draw(img)
+        if camera:
+            camera.compensate(landmarks)
+            if mesh is not None:
+                camera.compensate(mesh)
+        if not found(landmarks):
+            sequence.drop()
+
+        cTime = time.time()
+        fps = 1 / (cTime - pTime)
+        pTime = cTime
+
+        cv2.putText(img, str(int(fps)), (70, 50), cv2.FONT_HERSHEY_PLAIN, 3,
+                    (255, 0, 0), 3)
+        cv2.namedWindow('Image', cv2.WINDOW_NORMAL)
+        cv2.resizeWindow('Image', 800, 600)
+
+        cv2.imshow("Image", img)
+        cv2.waitKey(1)
+
+    if camera:
+        camera.report()
+
+    _dict = {
+        "bones": detector.bones,
+        "poses": sequence.toPoses(detector.bones)
+    }
+    with open(args.destination, "w+") as f:
+        json.dump(_dict, f)
+
+
+if __name__ == "__main__":
+    main()